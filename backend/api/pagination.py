@@ -1,5 +1,222 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Пагинация по ключу: следующая страница выбирается условием
+    "после последней строки" по полям view.cursor_ordering, без OFFSET.
+
+    Курсор непрозрачен для клиента - берется из ссылки next.
+    Общее количество считается, только если передан count=true.
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def __init__(self, page_size, page_size_query_param):
+        self.page_size = page_size
+        self.page_size_query_param = page_size_query_param
+
+    def get_page_size(self, request):
+        try:
+            return max(int(request.query_params[self.page_size_query_param]),
+                       1)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def encode_cursor(self, values):
+        data = json.dumps(values, default=str, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor, model):
+        """Значения полей сортировки из курсора."""
+        fields = [
+            model._meta.get_field(name.lstrip('-')) for name in self.ordering
+        ]
+        try:
+            values = json.loads(base64.urlsafe_b64decode(
+                cursor + '=' * (-len(cursor) % 4)))
+            if len(values) != len(fields):
+                raise ValueError
+            return [
+                field.to_python(value) for field, value in zip(fields, values)
+            ]
+        except (binascii.Error, TypeError, ValueError, ValidationError):
+            raise ParseError(self.invalid_cursor_message)
+
+    def after(self, values):
+        """Условие "строго после" позиции values при сортировке
+        self.ordering."""
+        condition = Q()
+        equal = {}
+        for name, value in zip(self.ordering, values):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = view.cursor_ordering
+        page_size = self.get_page_size(request)
+        self.count = None
+        if request.query_params.get(self.count_query_param) in (
+                'true', 'True', '1'):
+            self.count = queryset.count()
+        cursor = request.query_params.get(self.cursor_query_param)
+        queryset = queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(
+                self.after(self.decode_cursor(cursor, queryset.model)))
+        page = list(queryset[:page_size + 1])
+        self.next_position = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_position = [
+                getattr(page[-1], name.lstrip('-')) for name in self.ordering
+            ]
+        return page
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(
+            url, self.cursor_query_param,
+            self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([('next', self.get_next_link())])
+        if self.count is not None:
+            response['count'] = self.count
+        response['results'] = data
+        return Response(response)
 
 
 class LimitPagination(PageNumberPagination):
+    """Постраничная пагинация. Если у представления задан
+    cursor_ordering и в запросе есть параметр cursor (для первой
+    страницы - пустой), используется KeysetPagination."""
     page_size_query_param = 'limit'
+    cursor_query_param = KeysetPagination.cursor_query_param
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if (getattr(view, 'cursor_ordering', None)
+                and self.cursor_query_param in request.query_params):
+            self.keyset = KeysetPagination(
+                self.page_size, self.page_size_query_param)
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class ApproximatePage(Page):
+    """Страница, наличие следующей страницы у которой известно
+    по выборке, а не по общему количеству."""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, который берет количество из кэша (ключ - SQL запроса
+    с параметрами, то есть все фильтры) или, для больших выборок
+    в PostgreSQL, из оценки планировщика. Такое количество помечается
+    как приближенное (approximate), а страницы выбираются без проверки
+    номера по нему."""
+    approximate = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        key = 'count:' + hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+        count = cache.get(key)
+        if count is not None:
+            self.approximate = True
+            return count
+        count = self.estimate(queryset.db, sql, params)
+        if (count is not None
+                and count >= settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD):
+            self.approximate = True
+        else:
+            count = queryset.count()
+        cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+        return count
+
+    def estimate(self, using, sql, params):
+        """Оценка количества строк планировщиком PostgreSQL."""
+        connection = connections[using]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]['Plan']['Plan Rows']
+
+    def validate_number(self, number):
+        # Флаг approximate выставляется при подсчете количества.
+        self.count
+        if not self.approximate:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы должен быть числом.')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1.')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.approximate:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('Страница пуста.')
+        return ApproximatePage(
+            rows[:self.per_page], number, self, len(rows) > self.per_page)
+
+
+class ApproximateCountPagination(LimitPagination):
+    """LimitPagination с количеством из CachedCountPaginator.
+    Поле count_approximate показывает, что count может быть неточным."""
+    django_paginator_class = CachedCountPaginator
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.keyset is None:
+            response.data['count_approximate'] = (
+                self.page.paginator.approximate)
+        return response
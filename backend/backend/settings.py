@@ -68,6 +68,19 @@ DATABASES = {
     }
 }
 
+# Кэш должен быть общим для всех воркеров и для management-команд:
+# версии данных, которые меняют команды, должны доходить до сервера.
+# LocMemCache у каждого процесса свой.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION', default='/var/tmp/foodgram_cache'),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -120,6 +133,39 @@ DJOSER = {
     },
 }
 
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60 * 24
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+REFERENCE_CACHE_MAX_AGE = 60 * 5
+# Наибольшее время жизни справочников и индекса автодополнения
+# в памяти процесса, с.
+REFERENCE_LOCAL_MAX_AGE = 60
+# memory - индекс в памяти процесса, db - поиск по индексу в БД.
+INGREDIENT_AUTOCOMPLETE_BACKEND = os.getenv(
+    'INGREDIENT_AUTOCOMPLETE_BACKEND', default='memory')
+INGREDIENT_AUTOCOMPLETE_LIMIT = None
+BULK_RECIPES_MAX_ITEMS = 1000
+# Подбор рецептов по ингредиентам: наибольшее число результатов
+# и время жизни индекса в памяти процесса, с.
+COOK_MAX_RESULTS = 1000
+COOK_INDEX_MAX_AGE = 60 * 10
+# Лента подписок: рецепты авторов с большим числом подписчиков
+# добавляются в ленты при чтении, а не при публикации.
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+FEED_BACKFILL_LIMIT = 100
+# Конфигурация полнотекстового поиска PostgreSQL.
+SEARCH_CONFIG = 'russian'
+# Количество в ответах ApproximateCountPagination: время жизни в кэше
+# и порог, начиная с которого используется оценка планировщика.
+PAGINATION_COUNT_CACHE_TIMEOUT = 30
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = 10000
+# Уменьшенные копии картинок рецептов строятся в пуле потоков.
+IMAGE_PROCESSING_ASYNC = True
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+# Время жизни ответов анонимным пользователям в кэше ответов, с.
+RESPONSE_CACHE_TIMEOUT = 60 * 5
+# Время жизни фрагментов RecipeSerializer в кэше, с.
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
 STATIC_URL = '/static/'
 MEDIA_URL = '/media/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
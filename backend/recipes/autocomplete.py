@@ -0,0 +1,259 @@
+from bisect import bisect_left
+from itertools import groupby
+from time import monotonic
+
+from django.conf import settings
+
+from recipes import cache
+from recipes.models import Ingredient
+from recipes.serializers import IngredientSerializer
+
+# Индекс текущего процесса: (version, built, IngredientIndex).
+_index = None
+
+NGRAM = 3
+PREFIX, SUBSTRING, FUZZY = range(3)
+
+
+def normalize(value):
+    """Приводит название к виду для сравнения: регистр
+    (в том числе кириллица) и буква ё не учитываются."""
+    return value.casefold().replace('ё', 'е').strip()
+
+
+def ngrams(value):
+    return {value[i:i + NGRAM] for i in range(len(value) - NGRAM + 1)}
+
+
+def next_row(row, query, char):
+    """Следующая строка таблицы Левенштейна: расстояния от префиксов
+    query до начала слова, продолженного символом char."""
+    left = row[0] + 1
+    current = [left]
+    diagonal = row[0]
+    for up, query_char in zip(row[1:], query):
+        value = diagonal if query_char == char else diagonal + 1
+        if up + 1 < value:
+            value = up + 1
+        if left + 1 < value:
+            value = left + 1
+        current.append(value)
+        left, diagonal = value, up
+    return current
+
+
+def typo_bound(query):
+    """Допустимое число опечаток для длины запроса."""
+    if len(query) < 4:
+        return 0
+    return 1 if len(query) < 6 else 2
+
+
+class IngredientIndex:
+    """Отсортированный по нормализованному названию список ингредиентов.
+
+    Поиск по префиксу - двоичный поиск начала диапазона
+    и проход по нему до limit совпадений. Для поиска по подстроке
+    строятся списки вхождений триграмм названий (с пробелами по краям),
+    для поиска с опечатками - отсортированный список слов названий.
+    """
+
+    def __init__(self, ingredients):
+        entries = sorted(
+            (normalize(ingredient['name']), ingredient['id'], ingredient)
+            for ingredient in ingredients
+        )
+        self.keys = [key for key, _, _ in entries]
+        self.ingredients = [ingredient for _, _, ingredient in entries]
+        self.postings = {}
+        self.word_positions = {}
+        for position, key in enumerate(self.keys):
+            for gram in ngrams(f' {key} '):
+                self.postings.setdefault(gram, []).append(position)
+            for index, word in enumerate(key.split()):
+                self.word_positions.setdefault(word, []).append(
+                    (position, index))
+        self.words = sorted(self.word_positions)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def prefix(self, query, limit=None):
+        query = normalize(query)
+        result = []
+        position = bisect_left(self.keys, query)
+        while position < len(self.keys) and (
+                limit is None or len(result) < limit):
+            if not self.keys[position].startswith(query):
+                break
+            result.append(self.ingredients[position])
+            position += 1
+        return result
+
+    def substring_positions(self, query):
+        """Позиции названий, содержащих query."""
+        grams = ngrams(query)
+        if not grams:
+            return sorted(
+                (key.find(query), position)
+                for position, key in enumerate(self.keys) if query in key
+            )
+        postings = sorted(
+            (self.postings.get(gram, ()) for gram in grams), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+        return sorted(
+            (self.keys[position].find(query), position)
+            for position in candidates if query in self.keys[position]
+        )
+
+    def fuzzy_words(self, query, bound):
+        """Тройки (расстояние, близость, слово) для слов, начало которых
+        отличается от query не более чем на bound опечаток.
+
+        Расстояние - минимум последнего столбца таблицы Левенштейна
+        по началам слова длиной до len(query) + bound, так что
+        недописанный хвост слова не считается опечаткой. Близость -
+        расстояние до первых len(query) + 1 символов слова, по ней
+        упорядочиваются слова с равным расстоянием.
+
+        Опечатку в первой букве не ищем: это сужает проход до слов
+        на ту же букву, а такие опечатки редки. Слова отсортированы,
+        поэтому строки таблицы для общего с предыдущим словом начала
+        не пересчитываются, а слова с началом, которое уже дальше
+        bound от query, обрабатываются вместе.
+        """
+        size = len(query)
+        # rows[j] - строка для первых j символов слова,
+        # distances[j] - минимум последнего столбца по rows[1..j].
+        rows = [list(range(size + 1))]
+        distances = [bound + 1]
+        previous = ''
+        result = []
+        words = self.words
+        position = bisect_left(words, query[0])
+        while position < len(words) and words[position][0] == query[0]:
+            word = words[position][:size + bound]
+            limit = min(len(word), len(previous), len(rows) - 1)
+            common = 0
+            while common < limit and word[common] == previous[common]:
+                common += 1
+            del rows[common + 1:]
+            del distances[common + 1:]
+            for char in word[common:]:
+                row = next_row(rows[-1], query, char)
+                if min(row) > bound:
+                    break
+                rows.append(row)
+                distances.append(min(distances[-1], row[size]))
+            previous = word
+            end = position + 1
+            if len(rows) <= len(word):
+                # У слов с началом word[:len(rows)] те же строки таблицы.
+                end = bisect_left(
+                    words, word[:len(rows)] + chr(0x10ffff), end)
+            if distances[-1] <= bound:
+                target = min(size + 1, len(word))
+                closeness = (
+                    rows[target][size] if target < len(rows) else bound + 1)
+                result.extend(
+                    (distances[-1], closeness, word)
+                    for word in words[position:end]
+                )
+            position = end
+        return result
+
+    def fuzzy_positions(self, query, exclude, limit=None):
+        """Позиции названий, начало одного из слов которых отличается
+        от query не более чем на typo_bound опечаток. Слова берутся
+        группами с равными расстоянием и близостью, пока не наберется
+        limit названий."""
+        bound = typo_bound(query)
+        if not bound:
+            return []
+        words = sorted(self.fuzzy_words(query, bound))
+        best = {}
+        result = []
+        for key, group in groupby(words, key=lambda item: item[:2]):
+            matches = {}
+            for *_, word in group:
+                for position, index in self.word_positions[word]:
+                    if position in exclude or position in best:
+                        continue
+                    if position not in matches or index < matches[position]:
+                        matches[position] = index
+            best.update(matches)
+            result.extend(sorted(
+                (*key, index, len(self.keys[position]), position)
+                for position, index in matches.items()
+            ))
+            if limit is not None and len(result) >= limit:
+                break
+        return result
+
+    def fuzzy(self, query, limit=None):
+        """Ранжированный поиск: сначала совпадения по началу названия,
+        затем по подстроке, затем с опечатками."""
+        query = normalize(query)
+        if not query:
+            return self.prefix(query, limit)
+        tiers = [[], [], []]
+        position = bisect_left(self.keys, query)
+        while (position < len(self.keys)
+               and self.keys[position].startswith(query)
+               and (limit is None or len(tiers[PREFIX]) < limit)):
+            tiers[PREFIX].append(position)
+            position += 1
+        seen = set(tiers[PREFIX])
+        if limit is None or len(seen) < limit:
+            for _, position in self.substring_positions(query):
+                if position not in seen:
+                    tiers[SUBSTRING].append(position)
+                    seen.add(position)
+        if limit is None or len(seen) < limit:
+            tiers[FUZZY] = [
+                position for *_, position in self.fuzzy_positions(
+                    query, seen, None if limit is None else limit - len(seen))
+            ]
+        positions = [position for tier in tiers for position in tier]
+        return [self.ingredients[position] for position in positions[:limit]]
+
+
+def serialize_ingredients():
+    return IngredientSerializer(Ingredient.objects.all(), many=True).data
+
+
+def get_index():
+    """Индекс процесса. Перестраивается при смене версии справочника
+    ингредиентов и не реже REFERENCE_LOCAL_MAX_AGE; строится из кэша
+    справочника, а не из БД."""
+    global _index
+    version = cache.get_version('ingredients')
+    if (_index is None or _index[0] != version
+            or monotonic() - _index[1] > settings.REFERENCE_LOCAL_MAX_AGE):
+        ingredients = cache.get_reference(
+            'ingredients', version, serialize_ingredients)
+        _index = (version, monotonic(), IngredientIndex(ingredients))
+    return _index[2]
+
+
+def search_db(query, limit=None):
+    """Поиск по префиксу в БД. Использует индекс varchar_pattern_ops,
+    поэтому сравнение регистрозависимое: названия в справочнике
+    хранятся в нижнем регистре."""
+    queryset = Ingredient.objects.filter(
+        name__startswith=query.strip().lower()).order_by('name')
+    if limit is not None:
+        queryset = queryset[:limit]
+    return IngredientSerializer(queryset, many=True).data
+
+
+def search(query, limit=None, fuzzy=False):
+    """Ингредиенты, название которых начинается с query.
+    С fuzzy=True - ранжированный нечеткий поиск."""
+    if fuzzy:
+        return get_index().fuzzy(query, limit)
+    if settings.INGREDIENT_AUTOCOMPLETE_BACKEND == 'db':
+        return search_db(query, limit)
+    return get_index().prefix(query, limit)
@@ -0,0 +1,124 @@
+from itertools import islice
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+
+from recipes import cook, feed, images, response_cache, search
+from recipes.models import Ingredient, IngredientAmount, Recipe, Tag
+from recipes.serializers import BulkRecipeSerializer
+from users.models import User
+
+
+def collect_ids(items, field, key=None):
+    """Все числовые идентификаторы из поля field всех элементов."""
+    ids = set()
+    for item in items:
+        values = item.get(field) if isinstance(item, dict) else None
+        for value in values if isinstance(values, list) else ():
+            if key is not None:
+                value = value.get(key) if isinstance(value, dict) else None
+            try:
+                ids.add(int(value))
+            except (TypeError, ValueError):
+                pass
+    return ids
+
+
+def chunks(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def validate_items(items):
+    """Проверяет все элементы пакета. Тэги и ингредиенты загружаются
+    двумя запросами на весь пакет. Возвращает пары (индекс, данные)
+    для корректных элементов и ошибки для остальных."""
+    context = {
+        'known_tags': Tag.objects.in_bulk(collect_ids(items, 'tags')),
+        'known_ingredients': Ingredient.objects.in_bulk(
+            collect_ids(items, 'ingredients', 'id')),
+    }
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        serializer = BulkRecipeSerializer(data=item, context=context)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            errors.append({'index': index, 'errors': serializer.errors})
+    return valid, errors
+
+
+def create_recipes(author, batch):
+    """Создает рецепты пачкой: рецепты, связи с тэгами
+    и количества ингредиентов - по одному INSERT на каждую таблицу."""
+    recipes = [
+        Recipe(
+            author=author,
+            name=data['name'],
+            image=data['image'],
+            text=data['text'],
+            cooking_time=data['cooking_time'],
+        )
+        for data in batch
+    ]
+    if connection.features.can_return_rows_from_bulk_insert:
+        Recipe.objects.bulk_create(recipes)
+    else:
+        for recipe in recipes:
+            recipe.save()
+    tag_links, amounts = [], []
+    for recipe, data in zip(recipes, batch):
+        tag_links.extend(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for tag in data['tags']
+        )
+        amounts.extend(
+            IngredientAmount(
+                recipe=recipe,
+                ingredient=ingredient_data['ingredient'],
+                amount=ingredient_data['amount']
+            )
+            for ingredient_data in data['ingredients']
+        )
+    Recipe.tags.through.objects.bulk_create(tag_links)
+    IngredientAmount.objects.bulk_create(amounts)
+    User.objects.filter(pk=author.pk).update(
+        recipes_count=F('recipes_count') + len(recipes))
+    search.update_vectors([recipe.pk for recipe in recipes])
+    cook.recipes_changed(recipe.pk for recipe in recipes)
+    feed.fan_out(author, recipes)
+    response_cache.purge_recipes(
+        [recipe.pk for recipe in recipes], [author.pk])
+    images.schedule(recipes)
+    return recipes
+
+
+def import_recipes(author, items, batch_size=100):
+    """Пакетный импорт рецептов автора.
+
+    Каждая пачка из batch_size рецептов создается в своей транзакции.
+    Возвращает результат по каждому элементу: {'index', 'id'}
+    или {'index', 'errors'}.
+    """
+    items = list(items)
+    valid, results = validate_items(items)
+    for chunk in chunks(valid, batch_size):
+        indexes = [index for index, _ in chunk]
+        try:
+            with transaction.atomic():
+                recipes = create_recipes(author, [data for _, data in chunk])
+        except DatabaseError as error:
+            results.extend(
+                {'index': index, 'errors': {'non_field_errors': [str(error)]}}
+                for index in indexes
+            )
+            continue
+        results.extend(
+            {'index': index, 'id': recipe.id}
+            for index, recipe in zip(indexes, recipes)
+        )
+    return sorted(results, key=lambda result: result['index'])
@@ -0,0 +1,58 @@
+from time import monotonic
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'version:{}'
+REFERENCE_KEY = 'reference:{}:{}'
+
+# Справочники в памяти процесса: {name: (version, loaded, data)}.
+_local_references = {}
+
+
+def get_version(name):
+    """Текущая версия именованного набора данных.
+
+    Если версия вытеснена из кэша, назначается новая, и все ключи
+    со старой версией перестают находиться.
+    """
+    key = VERSION_KEY.format(name)
+    cache.add(key, uuid4().hex, None)
+    return cache.get(key)
+
+
+def bump_versions(names):
+    """Назначает новые версии после фиксации транзакции, чтобы
+    старые данные не попали в кэш под новой версией."""
+    keys = [VERSION_KEY.format(name) for name in names]
+    transaction.on_commit(
+        lambda: cache.set_many({key: uuid4().hex for key in keys}, None))
+
+
+def get_reference(name, version, build):
+    """Данные справочника: из памяти процесса (не дольше
+    REFERENCE_LOCAL_MAX_AGE), затем из общего кэша, и только
+    при промахе из build()."""
+    local = _local_references.get(name)
+    if (local is not None and local[0] == version
+            and monotonic() - local[1] <= settings.REFERENCE_LOCAL_MAX_AGE):
+        return local[2]
+    key = REFERENCE_KEY.format(name, version)
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, settings.REFERENCE_CACHE_TIMEOUT)
+    _local_references[name] = (version, monotonic(), data)
+    return data
+
+
+def get_versions(names):
+    """Текущие версии нескольких наборов данных одним запросом к кэшу."""
+    keys = {VERSION_KEY.format(name): name for name in names}
+    found = cache.get_many(list(keys))
+    return {
+        name: found[key] if key in found else get_version(name)
+        for key, name in keys.items()
+    }
@@ -0,0 +1,201 @@
+from collections import defaultdict
+from time import monotonic
+
+from django.conf import settings
+from django.db import transaction
+
+from recipes import cache
+from recipes.models import IngredientAmount
+
+# Индекс текущего процесса: (version, built_at, CookIndex).
+_index = None
+
+
+def to_mask(positions):
+    """Целое число с единичными битами в позициях positions."""
+    positions = list(positions)
+    if not positions:
+        return 0
+    data = bytearray(max(positions) // 8 + 1)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(data, 'little')
+
+
+def bit_positions(mask, limit=None):
+    """Позиции единичных битов mask от старших к младшим."""
+    bits = bin(mask)
+    top = len(bits) - 3
+    result = []
+    index = bits.find('1', 2)
+    while index != -1 and (limit is None or len(result) < limit):
+        result.append(top - (index - 2))
+        index = bits.find('1', index + 1)
+    return result
+
+
+class CookIndex:
+    """Битовые множества для подбора рецептов по имеющимся (include)
+    и исключенным (exclude) ингредиентам.
+
+    Каждому рецепту соответствует бит (рецепты упорядочены по id),
+    каждому ингредиенту и каждому размеру рецепта (числу ингредиентов) -
+    маска рецептов. Совпадения по include считаются побитовым
+    сумматором, так что запрос не перебирает рецепты по одному.
+    """
+
+    def __init__(self, rows=()):
+        """rows - пары (id рецепта, id ингредиента)."""
+        recipes = defaultdict(set)
+        for recipe_id, ingredient_id in rows:
+            recipes[recipe_id].add(ingredient_id)
+        self.recipes = {}
+        self.ids = sorted(recipes)
+        self.positions = {}
+        postings, sizes = defaultdict(list), defaultdict(list)
+        for position, recipe_id in enumerate(self.ids):
+            ingredient_ids = recipes[recipe_id]
+            self.recipes[recipe_id] = ingredient_ids
+            self.positions[recipe_id] = position
+            for ingredient_id in ingredient_ids:
+                postings[ingredient_id].append(position)
+            sizes[len(ingredient_ids)].append(position)
+        self.masks = defaultdict(int, {
+            ingredient_id: to_mask(positions)
+            for ingredient_id, positions in postings.items()
+        })
+        self.sizes = defaultdict(int, {
+            size: to_mask(positions) for size, positions in sizes.items()
+        })
+        self.alive = (1 << len(self.ids)) - 1
+
+    def update(self, recipe_id, ingredient_ids):
+        """Заменяет ингредиенты рецепта; пустой набор удаляет рецепт."""
+        position = self.positions.get(recipe_id)
+        if position is None:
+            if not ingredient_ids:
+                return
+            position = self.positions[recipe_id] = len(self.ids)
+            self.ids.append(recipe_id)
+        bit = 1 << position
+        old = self.recipes.pop(recipe_id, set())
+        for ingredient_id in old:
+            self.masks[ingredient_id] &= ~bit
+        self.sizes[len(old)] &= ~bit
+        self.alive &= ~bit
+        if ingredient_ids:
+            self.recipes[recipe_id] = set(ingredient_ids)
+            for ingredient_id in ingredient_ids:
+                self.masks[ingredient_id] |= bit
+            self.sizes[len(self.recipes[recipe_id])] |= bit
+            self.alive |= bit
+
+    def counts(self, include, allowed):
+        """Разряды (младший первый) числа совпадений с include
+        для каждого рецепта."""
+        planes = []
+        for ingredient_id in include:
+            carry = self.masks.get(ingredient_id, 0) & allowed
+            for index, plane in enumerate(planes):
+                planes[index], carry = plane ^ carry, plane & carry
+                if not carry:
+                    break
+            if carry:
+                planes.append(carry)
+        return planes
+
+    def equal(self, planes, count, allowed):
+        """Маска рецептов с числом совпадений, равным count."""
+        if count >= 1 << len(planes):
+            return 0
+        mask = allowed
+        for index, plane in enumerate(planes):
+            mask &= plane if count >> index & 1 else ~plane
+        return mask
+
+    def ranked_masks(self, include, allowed):
+        """Маски рецептов в порядке выдачи с числом недостающих
+        ингредиентов. Пары (есть, всего) с одинаковым ключом сортировки
+        (полное покрытие: 1 из 1, 2 из 2...) объединяются в одну маску,
+        чтобы внутри нее рецепты шли от новых к старым."""
+        groups = defaultdict(list)
+        for total in self.sizes:
+            for count in range(1, min(total, len(include)) + 1):
+                groups[-count / total, total - count].append((count, total))
+        planes = self.counts(include, allowed)
+        equal = {}
+        for key in sorted(groups):
+            mask = 0
+            for count, total in groups[key]:
+                if count not in equal:
+                    equal[count] = self.equal(planes, count, allowed)
+                mask |= equal[count] & self.sizes[total]
+            if mask:
+                yield key[1], mask
+
+    def search(self, include, exclude=(), limit=None):
+        """Рецепты, в которых есть хотя бы один ингредиент из include
+        и нет ни одного из exclude, по убыванию покрытия (доли
+        ингредиентов рецепта из include), затем по числу недостающих,
+        затем начиная с новых.
+
+        Возвращает список (id рецепта, есть, всего). Без include -
+        все рецепты без exclude, начиная с новых.
+        """
+        excluded = 0
+        for ingredient_id in set(exclude):
+            excluded |= self.masks.get(ingredient_id, 0)
+        allowed = self.alive & ~excluded
+        if not include:
+            return [
+                (self.ids[position], 0,
+                 len(self.recipes[self.ids[position]]))
+                for position in bit_positions(allowed, limit)
+            ]
+        result = []
+        for missing, mask in self.ranked_masks(set(include), allowed):
+            remaining = None if limit is None else limit - len(result)
+            for position in bit_positions(mask, remaining):
+                recipe_id = self.ids[position]
+                total = len(self.recipes[recipe_id])
+                result.append((recipe_id, total - missing, total))
+            if limit is not None and len(result) >= limit:
+                break
+        return result
+
+
+def get_index():
+    """Индекс текущего процесса. Перестраивается при смене версии
+    (изменения в других процессах) и не реже COOK_INDEX_MAX_AGE."""
+    global _index
+    version = cache.get_version('cook')
+    if (_index is None or _index[0] != version
+            or monotonic() - _index[1] > settings.COOK_INDEX_MAX_AGE):
+        rows = IngredientAmount.objects.values_list(
+            'recipe_id', 'ingredient_id').iterator()
+        _index = (version, monotonic(), CookIndex(rows))
+    return _index[2]
+
+
+def recipes_changed(recipe_ids):
+    """После фиксации транзакции применяет новые ингредиенты рецептов
+    к индексу текущего процесса и меняет версию, чтобы остальные
+    процессы перестроили свои индексы."""
+    recipe_ids = list(recipe_ids)
+
+    def apply():
+        global _index
+        fresh = _index is not None and _index[0] == cache.get_version('cook')
+        cache.bump_versions(['cook'])
+        if not fresh:
+            return
+        ingredients = {recipe_id: set() for recipe_id in recipe_ids}
+        for recipe_id, ingredient_id in IngredientAmount.objects.filter(
+                recipe_id__in=recipe_ids).values_list(
+                    'recipe_id', 'ingredient_id'):
+            ingredients[recipe_id].add(ingredient_id)
+        for recipe_id, ingredient_ids in ingredients.items():
+            _index[2].update(recipe_id, ingredient_ids)
+        _index = (cache.get_version('cook'), _index[1], _index[2])
+
+    transaction.on_commit(apply)
@@ -0,0 +1,159 @@
+import csv
+import json
+import os
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from fpdf import FPDF
+from fpdf.fpdf import SubsetMap
+
+FONT_FAMILY = 'Shentox'
+FONT_PATH = os.path.join(settings.BASE_DIR, 'backend', 'fonts', 'Shentox.ttf')
+FILENAME = 'список_покупок'
+TITLE = 'Список покупок'
+
+
+@lru_cache(maxsize=None)
+def load_font():
+    """Разбирает файл шрифта один раз на процесс
+    и возвращает готовые описания шрифта для FPDF."""
+    pdf = FPDF()
+    pdf.add_font(FONT_FAMILY, fname=FONT_PATH)
+    key = FONT_FAMILY.lower()
+    return pdf.fonts[key], pdf.font_files[key]
+
+
+class ShoppingListPDF(FPDF):
+    """PDF-документ, использующий предзагруженный шрифт."""
+
+    def add_cached_font(self):
+        font, font_file = load_font()
+        key = font['fontkey']
+        # subset и номер объекта у каждого документа свои.
+        self.fonts[key] = {
+            **font,
+            'i': len(self.fonts) + 1,
+            'subset': SubsetMap(map(ord, '\x00 ')),
+        }
+        self.font_files[key] = dict(font_file)
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+class BaseRenderer:
+    """Рендерер списка покупок.
+
+    Принимает итерируемый набор словарей с ключами
+    name, measurement_unit и total.
+    """
+    content_type = None
+    extension = None
+    streaming = True
+    cacheable = False
+
+    def render(self, items):
+        """Генератор фрагментов документа."""
+        raise NotImplementedError
+
+    def make_response(self, content):
+        response_class = (
+            StreamingHttpResponse if self.streaming else HttpResponse)
+        response = response_class(content, content_type=self.content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="{FILENAME}.{self.extension}"')
+        return response
+
+    def response(self, items, cache_key=None):
+        """Ответ с документом. Для рендереров с cacheable = True
+        готовый документ берется из кэша по cache_key."""
+        if not (self.cacheable and cache_key):
+            return self.make_response(self.render(items))
+        content = cache.get(cache_key)
+        if content is None:
+            content = self.render(items)
+            cache.set(
+                cache_key, content, settings.SHOPPING_LIST_CACHE_TIMEOUT)
+        return self.make_response(content)
+
+
+class TextRenderer(BaseRenderer):
+    content_type = 'text/plain; charset=utf-8'
+    extension = 'txt'
+
+    def render(self, items):
+        yield f'{TITLE}\n\n'
+        for i, item in enumerate(items):
+            yield (f'{i + 1}) {item["name"]} - '
+                   f'{item["total"]} {item["measurement_unit"]}\n')
+
+
+class CSVRenderer(BaseRenderer):
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+
+    def render(self, items):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'measurement_unit', 'amount'))
+        for item in items:
+            yield writer.writerow(
+                (item['name'], item['measurement_unit'], item['total']))
+
+
+class JSONRenderer(BaseRenderer):
+    content_type = 'application/json'
+    extension = 'json'
+
+    def render(self, items):
+        yield '['
+        for i, item in enumerate(items):
+            yield (',' if i else '') + json.dumps({
+                'name': item['name'],
+                'measurement_unit': item['measurement_unit'],
+                'amount': item['total'],
+            }, ensure_ascii=False)
+        yield ']'
+
+
+class PDFRenderer(BaseRenderer):
+    content_type = 'application/pdf'
+    extension = 'pdf'
+    # PDF собирается целиком, поэтому отдается обычным ответом,
+    # а сборка дорогая, поэтому результат кэшируется.
+    streaming = False
+    cacheable = True
+
+    def render(self, items):
+        pdf = ShoppingListPDF()
+        pdf.add_page()
+        pdf.add_cached_font()
+        pdf.set_font(FONT_FAMILY, size=12)
+        pdf.cell(txt=TITLE, center=True)
+        pdf.ln(10)
+        for i, item in enumerate(items):
+            pdf.cell(
+                30, 10,
+                f'{i + 1}) {item["name"]} - '
+                f'{item["total"]} {item["measurement_unit"]}'
+            )
+            pdf.ln()
+        return bytes(pdf.output())
+
+
+RENDERERS = {
+    renderer.extension: renderer
+    for renderer in (
+        PDFRenderer(), TextRenderer(), CSVRenderer(), JSONRenderer()
+    )
+}
+
+
+def get_renderer(extension):
+    """Рендерер по расширению файла или None."""
+    return RENDERERS.get(extension)
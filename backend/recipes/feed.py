@@ -0,0 +1,79 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import F, OuterRef, Q, Subquery
+
+from recipes.models import FeedEntry, Recipe
+from users.models import Subscription, User
+
+ORDERING = ('-pub_date', '-recipe_id')
+
+
+def is_fanned_out(author):
+    """Рецепты автора раскладываются по лентам при публикации, если
+    подписчиков не больше FEED_FANOUT_MAX_FOLLOWERS; ленты подписчиков
+    остальных авторов дополняются при чтении (pull)."""
+    return author.followers_count <= settings.FEED_FANOUT_MAX_FOLLOWERS
+
+
+def entries(user_ids, recipes):
+    return (
+        FeedEntry(
+            user_id=user_id, recipe=recipe,
+            author_id=recipe.author_id, pub_date=recipe.pub_date
+        )
+        for user_id in user_ids for recipe in recipes
+    )
+
+
+def fan_out(author, recipes, batch_size=1000):
+    """Добавляет новые рецепты автора в ленты его подписчиков."""
+    if not is_fanned_out(author):
+        return
+    followers = Subscription.objects.filter(
+        author=author).values_list('user_id', flat=True)
+    rows = entries(list(followers), list(recipes))
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def backfill(user, author):
+    """Добавляет в ленту последние рецепты автора при подписке."""
+    recipes = author.recipes.only('id', 'author_id', 'pub_date').order_by(
+        '-pub_date')[:settings.FEED_BACKFILL_LIMIT]
+    FeedEntry.objects.bulk_create(
+        entries([user.pk], recipes), ignore_conflicts=True)
+
+
+def remove(user, author):
+    """Убирает рецепты автора из ленты при отписке."""
+    FeedEntry.objects.filter(user=user, author=author).delete()
+
+
+def pull(user):
+    """Дополняет ленту рецептами авторов с большим числом подписчиков,
+    опубликованными после последней записи этого автора в ленте."""
+    authors = User.objects.filter(
+        following__user=user,
+        followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    )
+    latest = FeedEntry.objects.filter(
+        user=user, author=OuterRef('author')
+    ).order_by('-pub_date').values('pub_date')[:1]
+    recipes = Recipe.objects.filter(author__in=authors).annotate(
+        seen=Subquery(latest)
+    ).filter(
+        Q(seen__isnull=True) | Q(pub_date__gt=F('seen'))
+    ).only('id', 'author_id', 'pub_date').order_by(
+        '-pub_date')[:settings.FEED_BACKFILL_LIMIT]
+    FeedEntry.objects.bulk_create(
+        entries([user.pk], recipes), ignore_conflicts=True)
+
+
+def get_queryset(user):
+    """Записи ленты пользователя в порядке ORDERING."""
+    pull(user)
+    return FeedEntry.objects.filter(user=user).order_by(*ORDERING)
@@ -1,19 +1,81 @@
-from django_filters import ModelMultipleChoiceFilter
+from django import forms
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
 
+from recipes import cache, search
 from recipes.models import Recipe, Tag
+from recipes.serializers import TagSerializer
 from users.models import User
 
+POPULAR_ORDERING = ('-favorites_count', '-pub_date', '-id')
+ORDERINGS = (
+    ('popular', 'Сначала популярные'),
+)
+TAGS_MODES = (
+    ('any', 'Хотя бы один из тэгов'),
+    ('all', 'Все тэги'),
+)
 
-class RecipeFilter(FilterSet):
-    tags = ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all()
+
+def tag_ids(slugs):
+    """Идентификаторы тэгов по slug из закэшированного справочника."""
+    tags = cache.get_reference(
+        'tags', cache.get_version('tags'),
+        lambda: TagSerializer(Tag.objects.all(), many=True).data
     )
+    ids = {tag['slug']: tag['id'] for tag in tags}
+    return [ids[slug] for slug in slugs if slug in ids]
+
+
+class SlugsField(forms.MultipleChoiceField):
+    """Список slug; существование проверяется при фильтрации."""
+
+    def valid_value(self, value):
+        return True
+
+
+class SlugsFilter(filters.MultipleChoiceFilter):
+    field_class = SlugsField
+
+
+class RecipeFilter(FilterSet):
+    search = filters.CharFilter(method='filter_search')
+    tags = SlugsFilter(method='filter_tags')
+    tags_mode = filters.ChoiceFilter(
+        choices=TAGS_MODES, method='filter_tags_mode')
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
     is_favorited = filters.BooleanFilter(method='filter_favorited')
     is_in_shopping_cart = filters.BooleanFilter(method='filter_shopping_cart')
+    ordering = filters.ChoiceFilter(
+        choices=ORDERINGS, method='filter_ordering')
+
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск по названию, ингредиентам и описанию;
+        результаты по убыванию релевантности, если не задан ordering."""
+        return search.search(queryset, value)
+
+    def filter_tags(self, queryset, name, value):
+        """Рецепты с любым (tags_mode=any, по умолчанию) или со всеми
+        (tags_mode=all) тэгами. Подзапрос EXISTS по связующей таблице
+        не размножает строки рецептов и не требует DISTINCT."""
+        ids = tag_ids(value)
+        mode = self.form.cleaned_data.get('tags_mode') or 'any'
+        if not ids or mode == 'all' and len(ids) < len(set(value)):
+            return queryset.none()
+        links = Recipe.tags.through.objects.filter(recipe=OuterRef('pk'))
+        if mode == 'any':
+            return queryset.filter(Exists(links.filter(tag__in=ids)))
+        for tag_id in ids:
+            queryset = queryset.filter(Exists(links.filter(tag=tag_id)))
+        return queryset
+
+    def filter_tags_mode(self, queryset, name, value):
+        # Учитывается в filter_tags.
+        return queryset
+
+    def filter_ordering(self, queryset, name, value):
+        """Сортировка по числу добавлений в избранное."""
+        return queryset.order_by(*POPULAR_ORDERING)
 
     def filter_favorited(self, queryset, name, value):
         if value:
@@ -0,0 +1,112 @@
+import hashlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache as django_cache
+from django.db.models import IntegerField, Value
+
+from recipes import cache, response_cache
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription
+
+FRAGMENT_KEY = 'fragment:{}:{}'
+FAVORITED, IN_SHOPPING_CART, SUBSCRIBED = range(3)
+
+
+def fragment_keys(recipes, request=None):
+    """Ключи фрагментов рецептов. В ключ входят версии рецепта,
+    его автора и справочников (см. recipes.response_cache), поэтому
+    старые фрагменты просто перестают находиться."""
+    names = set(response_cache.REFERENCES)
+    for recipe in recipes:
+        names.add(response_cache.recipe_key(recipe.pk))
+        names.add(response_cache.user_key(recipe.author_id))
+    versions = cache.get_versions(names)
+    if request is not None:
+        # Кэш ответов сохраняет ответ с версиями, прочитанными
+        # до построения фрагментов (RecipeViewSet.cached_response).
+        request.fragment_versions = {
+            **getattr(request, 'fragment_versions', {}), **versions}
+    # Картинки в представлении - абсолютные ссылки.
+    base = request.build_absolute_uri('/') if request else ''
+    keys = {}
+    for recipe in recipes:
+        raw = '|'.join([
+            base,
+            versions[response_cache.recipe_key(recipe.pk)],
+            versions[response_cache.user_key(recipe.author_id)],
+            *(versions[name] for name in response_cache.REFERENCES),
+        ])
+        keys[recipe.pk] = FRAGMENT_KEY.format(
+            recipe.pk, hashlib.md5(raw.encode()).hexdigest())
+    return keys
+
+
+def user_flags(user, recipe_ids, author_ids):
+    """Избранное, корзина и подписки пользователя среди рецептов
+    и авторов ответа: {FAVORITED: ids, IN_SHOPPING_CART: ids,
+    SUBSCRIBED: ids} одним запросом."""
+    flags = {FAVORITED: set(), IN_SHOPPING_CART: set(), SUBSCRIBED: set()}
+    if user is None or not user.is_authenticated:
+        return flags
+    queries = [
+        Favorite.objects.filter(user=user, recipe__in=recipe_ids).annotate(
+            flag=Value(FAVORITED, output_field=IntegerField())
+        ).values_list('recipe_id', 'flag'),
+        ShoppingCart.objects.filter(
+            user=user, recipe__in=recipe_ids).annotate(
+            flag=Value(IN_SHOPPING_CART, output_field=IntegerField())
+        ).values_list('recipe_id', 'flag'),
+        Subscription.objects.filter(
+            user=user, author__in=author_ids).annotate(
+            flag=Value(SUBSCRIBED, output_field=IntegerField())
+        ).values_list('author_id', 'flag'),
+    ]
+    queries = [query.order_by() for query in queries]
+    for object_id, flag in queries[0].union(*queries[1:], all=True):
+        flags[flag].add(object_id)
+    return flags
+
+
+def render(recipes, serializer):
+    """Представления рецептов для RecipeSerializer.
+
+    Не зависящая от пользователя часть (serializer.fragment) берется
+    из кэша; для промахов рецепты заново загружаются со всеми связями
+    уже после чтения версий, чтобы изменение во время запроса
+    не попало в кэш под новой версией. Поверх фрагментов
+    подставляются флаги пользователя из user_flags.
+    """
+    request = serializer.context.get('request')
+    keys = fragment_keys(recipes, request)
+    fragments = django_cache.get_many(list(set(keys.values())))
+    missing = [
+        recipe.pk for recipe in recipes if keys[recipe.pk] not in fragments
+    ]
+    if missing:
+        built = {
+            keys[pk]: serializer.fragment(recipe)
+            for pk, recipe in Recipe.objects.with_related().in_bulk(
+                missing).items()
+        }
+        django_cache.set_many(built, settings.FRAGMENT_CACHE_TIMEOUT)
+        fragments.update(built)
+    flags = user_flags(
+        getattr(request, 'user', None),
+        {recipe.pk for recipe in recipes},
+        {recipe.author_id for recipe in recipes}
+    )
+    result = []
+    for recipe in recipes:
+        fragment = fragments.get(keys[recipe.pk])
+        if fragment is None:
+            # Рецепт удален во время запроса.
+            fragment = serializer.fragment(recipe)
+        data = OrderedDict(fragment)
+        data['is_favorited'] = recipe.pk in flags[FAVORITED]
+        data['is_in_shopping_cart'] = recipe.pk in flags[IN_SHOPPING_CART]
+        data['author'] = OrderedDict(data['author'])
+        data['author']['is_subscribed'] = (
+            recipe.author_id in flags[SUBSCRIBED])
+        result.append(data)
+    return result
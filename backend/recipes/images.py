@@ -0,0 +1,140 @@
+import hashlib
+import io
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image
+
+from recipes import response_cache
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'recipes/variants'
+# Название варианта: наибольшая сторона в пикселях.
+SIZES = {'small': 320, 'medium': 960}
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            thread_name_prefix='recipe-images'
+        )
+    return _executor
+
+
+def variant_name(image_hash, size, extension):
+    return posixpath.join(VARIANTS_DIR, image_hash, f'{size}.{extension}')
+
+
+def render_variant(image, size, image_format):
+    variant = image.copy()
+    variant.thumbnail((SIZES[size], SIZES[size]), Image.LANCZOS)
+    buffer = io.BytesIO()
+    variant.save(buffer, image_format, quality=80)
+    return buffer.getvalue()
+
+
+def supported_formats():
+    """Форматы вариантов, которые умеет сохранять установленный
+    Pillow (WebP есть не во всех сборках)."""
+    Image.init()
+    return {
+        extension: image_format
+        for extension, image_format in FORMATS.items()
+        if image_format in Image.SAVE
+    }
+
+
+def process_image(recipe_id):
+    """Считает хэш содержимого картинки рецепта, сохраняет варианты
+    и записывает хэш в рецепт. Одинаковые картинки разных рецептов
+    используют одни и те же файлы вариантов."""
+    recipe = Recipe.objects.filter(pk=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return
+    with recipe.image.open('rb') as file:
+        content = file.read()
+    image_hash = hashlib.sha256(content).hexdigest()
+    missing = [
+        (size, extension, image_format)
+        for size in SIZES
+        for extension, image_format in supported_formats().items()
+        if not default_storage.exists(
+            variant_name(image_hash, size, extension))
+    ]
+    if missing:
+        with Image.open(io.BytesIO(content)) as image:
+            image = image.convert('RGB')
+            for size, extension, image_format in missing:
+                default_storage.save(
+                    variant_name(image_hash, size, extension),
+                    ContentFile(render_variant(image, size, image_format)))
+    # Картинка могла смениться, пока шла обработка.
+    if Recipe.objects.filter(pk=recipe_id, image=recipe.image.name).update(
+            image_hash=image_hash):
+        response_cache.purge_recipes([recipe_id])
+
+
+def run(recipe_id):
+    """Обработка без исключений: ошибка записывается в лог, а рецепт
+    с пустым image_hash обработает команда process_recipe_images.
+    Возвращает True, если обработка прошла успешно."""
+    try:
+        process_image(recipe_id)
+    except Exception:
+        logger.exception('Ошибка обработки картинки рецепта %s', recipe_id)
+        return False
+    return True
+
+
+def run_in_thread(recipe_id):
+    try:
+        run(recipe_id)
+    finally:
+        close_old_connections()
+
+
+def schedule(recipes):
+    """Ставит обработку картинок рецептов в пул после фиксации
+    транзакции; при IMAGE_PROCESSING_ASYNC = False - выполняет сразу.
+    Задачи пула теряются при перезапуске воркера: такие рецепты
+    остаются с пустым image_hash до запуска process_recipe_images."""
+    recipe_ids = [recipe.id for recipe in recipes]
+
+    def submit():
+        for recipe_id in recipe_ids:
+            if settings.IMAGE_PROCESSING_ASYNC:
+                get_executor().submit(run_in_thread, recipe_id)
+            else:
+                run(recipe_id)
+
+    transaction.on_commit(submit)
+
+
+def variant_urls(recipe, request=None):
+    """Адреса вариантов картинки или None, если они еще не готовы."""
+    if not recipe.image_hash:
+        return None
+
+    def url(name):
+        url = default_storage.url(name)
+        return request.build_absolute_uri(url) if request else url
+
+    return {
+        size: {
+            extension: url(variant_name(recipe.image_hash, size, extension))
+            for extension in supported_formats()
+        }
+        for size in SIZES
+    }
@@ -0,0 +1,13 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.db.models import Index
+
+
+class SearchIndex(GinIndex):
+    """GIN-индекс в PostgreSQL; в остальных СУБД (SQLite в тестах) -
+    обычный индекс, чтобы схема создавалась на любой базе."""
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return Index.create_sql(
+                self, model, schema_editor, using=using, **kwargs)
+        return super().create_sql(model, schema_editor, using, **kwargs)
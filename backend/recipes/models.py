@@ -1,6 +1,12 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
+from django.db.models import F, Prefetch, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
 
+from recipes.indexes import SearchIndex
+from recipes.storage import ContentAddressedStorage
 from users.models import User
 
 
@@ -46,11 +52,58 @@ class Ingredient(models.Model):
 
     class Meta:
         ordering = ('id',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_unit'
+            )
+        ]
+        indexes = [
+            # Индекс для поиска по префиксу (LIKE 'x%') в PostgreSQL.
+            models.Index(
+                fields=['name'],
+                name='ingredient_name_prefix_idx',
+                opclasses=['varchar_pattern_ops']
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self):
+        """План загрузки всего графа рецепта для RecipeSerializer:
+        автор, тэги и ингредиенты загружаются фиксированным числом
+        запросов независимо от числа рецептов."""
+        return self.defer('search_vector').prefetch_related(
+            'author',
+            Prefetch('tags', queryset=Tag.objects.all()),
+            Prefetch(
+                'ingredientamount_set',
+                queryset=IngredientAmount.objects.select_related(
+                    'ingredient')
+            ),
+        )
+
+    def latest_per_author(self, authors, limit=None):
+        """Последние рецепты авторов, не более limit на каждого,
+        одним запросом с ROW_NUMBER() по автору."""
+        queryset = self.filter(author__in=authors)
+        if limit is None:
+            return queryset
+        ranked = queryset.order_by().annotate(row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('author')],
+            order_by=[F('pub_date').desc(), F('id').desc()],
+        )).values('id', 'row_number')
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(pk__in=RawSQL(
+            f'SELECT "id" FROM ({sql}) AS "ranked" WHERE "row_number" <= %s',
+            (*params, limit)
+        ))
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -64,7 +117,14 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         verbose_name='Картинка',
-        upload_to='recipes/'
+        upload_to='recipes/',
+        storage=ContentAddressedStorage()
+    )
+    image_hash = models.CharField(
+        verbose_name='Хэш картинки',
+        max_length=64,
+        blank=True,
+        editable=False
     )
     text = models.TextField(
         verbose_name='Текстовое описание'
@@ -93,8 +153,47 @@ class Recipe(models.Model):
         ]
     )
 
+    # Счетчики обновляются вместе с Favorite и ShoppingCart
+    # (RecipeViewSet.add, delete_relation) и сверяются командой
+    # recount_counters.
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        verbose_name='В корзинах',
+        default=0,
+        editable=False
+    )
+
+    # Поддерживается recipes.search.update_vectors.
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            # Индекс для пагинации по ключу (pub_date, id).
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            # Индекс для сортировки ordering=popular.
+            models.Index(
+                fields=['-favorites_count', '-pub_date', '-id'],
+                name='recipe_popular_idx'
+            ),
+            SearchIndex(
+                fields=['search_vector'],
+                name='recipe_search_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -137,6 +236,8 @@ class Favorite(models.Model):
         related_name='favorite'
     )
 
+    counter_field = 'favorites_count'
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -158,6 +259,8 @@ class ShoppingCart(models.Model):
         related_name='sh_cart'
     )
 
+    counter_field = 'shopping_cart_count'
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -165,3 +268,72 @@ class ShoppingCart(models.Model):
                 name='unique_cart_recipe'
             )
         ]
+
+
+class ShoppingListItem(models.Model):
+    """Сводный список покупок пользователя.
+
+    Поддерживается инкрементально при изменении корзины
+    и ингредиентов рецептов (см. recipes.shopping_list).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_ingredient'
+            )
+        ]
+
+
+class FeedEntry(models.Model):
+    """Лента рецептов авторов, на которых подписан пользователь.
+
+    Заполняется при публикации рецепта (см. recipes.feed), чтобы
+    чтение ленты было одним проходом по индексу (user, pub_date).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_entry_user_pub_date_idx'
+            ),
+        ]
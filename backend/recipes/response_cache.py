@@ -0,0 +1,75 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache as django_cache
+
+from recipes import cache
+
+RESPONSE_KEY = 'response:{}'
+# Суррогатные ключи - имена версий из recipes.cache. Смена версии
+# ключа делает недействительными все ответы, которые от него зависят.
+RECIPES = 'recipes'
+FAVORITES = 'favorites'
+REFERENCES = ('tags', 'ingredients')
+
+
+def recipe_key(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+def user_key(user_id):
+    return f'user:{user_id}'
+
+
+def purge(keys):
+    """Делает недействительными ответы с любым из ключей keys
+    после фиксации транзакции."""
+    cache.bump_versions(keys)
+
+
+def purge_recipes(recipe_ids=(), author_ids=()):
+    """Сброс после создания, изменения или удаления рецептов:
+    списки, сами рецепты и авторы (у них меняется recipes_count)."""
+    purge(
+        [RECIPES]
+        + [recipe_key(recipe_id) for recipe_id in recipe_ids]
+        + [user_key(author_id) for author_id in author_ids]
+    )
+
+
+def response_key(request):
+    """Ключ ответа: адрес (картинки в ответе - абсолютные ссылки)
+    и параметры запроса без учета их порядка и пустых значений."""
+    params = sorted(
+        (name, sorted(value for value in values if value))
+        for name, values in request.query_params.lists()
+        if any(values)
+    )
+    raw = f'{request.build_absolute_uri(request.path)}?{params}'
+    return RESPONSE_KEY.format(hashlib.md5(raw.encode()).hexdigest())
+
+
+def load(request):
+    """Данные ответа и его суррогатные ключи или None, если ответа
+    нет в кэше или версия хотя бы одного ключа сменилась."""
+    entry = django_cache.get(response_key(request))
+    if entry is None:
+        return None
+    versions = entry['versions']
+    if cache.get_versions(versions) != versions:
+        return None
+    return entry['data'], list(versions)
+
+
+def store(request, data, versions):
+    """Сохраняет данные ответа с версиями ключей, от которых он
+    зависит. Версии нужно взять до построения ответа, иначе изменение
+    во время запроса попадет в кэш под новой версией."""
+    django_cache.set(
+        response_key(request), {'versions': versions, 'data': data},
+        settings.RESPONSE_CACHE_TIMEOUT)
+
+
+def header(keys):
+    """Значение заголовка Surrogate-Key для CDN."""
+    return ' '.join(keys)
@@ -0,0 +1,149 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection, transaction
+from django.db.models import Case, F, FloatField, TextField, Value, When
+from django.db.models.expressions import RawSQL
+
+from recipes import cache
+from recipes.models import Ingredient, IngredientAmount, Recipe
+
+# Веса полей: A - название, B - ингредиенты, C - описание.
+# Значения для индекса в памяти как у ts_rank по умолчанию.
+WEIGHTS = {'A': 1.0, 'B': 0.4, 'C': 0.2}
+ORDERING = ('-search_rank', '-pub_date', '-id')
+
+# Индекс текущего процесса для СУБД без полнотекстового
+# поиска: (version, InvertedIndex).
+_index = None
+
+
+def tokenize(value):
+    """Слова текста без учета регистра и буквы ё."""
+    return re.findall(r'\w+', value.casefold().replace('ё', 'е'))
+
+
+def ingredient_names():
+    """Подзапрос: названия ингредиентов рецепта через пробел."""
+    quote = connection.ops.quote_name
+    return RawSQL(
+        f'SELECT string_agg(i.name, \' \') '
+        f'FROM {quote(IngredientAmount._meta.db_table)} a '
+        f'JOIN {quote(Ingredient._meta.db_table)} i '
+        f'ON i.id = a.ingredient_id '
+        f'WHERE a.recipe_id = {quote(Recipe._meta.db_table)}.id',
+        (), output_field=TextField()
+    )
+
+
+def update_vectors(recipe_ids):
+    """Пересчитывает поисковые векторы рецептов (в PostgreSQL)
+    и сбрасывает индекс в памяти (для остальных СУБД) после фиксации
+    транзакции. Рецепты из всех вызовов в транзакции (сериализатор,
+    сигналы сохранения рецепта и его ингредиентов) обновляются одним
+    запросом."""
+    # Набор хранится в соединении: у каждого потока свое.
+    pending = getattr(connection, 'pending_search_vectors', None)
+    if pending is None:
+        pending = connection.pending_search_vectors = set()
+    pending.update(recipe_ids)
+    transaction.on_commit(flush_vectors)
+
+
+def flush_vectors():
+    # После отката транзакции в наборе могут остаться рецепты:
+    # они пересчитываются вместе со следующими, это безвредно.
+    recipe_ids = list(connection.pending_search_vectors)
+    if not recipe_ids:
+        return
+    connection.pending_search_vectors.clear()
+    if connection.vendor == 'postgresql':
+        config = settings.SEARCH_CONFIG
+        Recipe.objects.filter(pk__in=recipe_ids).update(search_vector=(
+            SearchVector('name', weight='A', config=config)
+            + SearchVector(ingredient_names(), weight='B', config=config)
+            + SearchVector('text', weight='C', config=config)
+        ))
+    cache.bump_versions(['search'])
+
+
+class InvertedIndex:
+    """Обратный индекс: слово -> {id рецепта: вес}. Слова запроса
+    ищутся по началу, рецепт должен содержать все слова запроса."""
+
+    def __init__(self, documents):
+        """documents - {id рецепта: [(текст, вес), ...]}."""
+        self.postings = defaultdict(dict)
+        for recipe_id, fields in documents.items():
+            for text, weight in fields:
+                for term in set(tokenize(text)):
+                    scores = self.postings[term]
+                    scores[recipe_id] = (
+                        scores.get(recipe_id, 0) + WEIGHTS[weight])
+        self.terms = sorted(self.postings)
+
+    def matches(self, word):
+        result = {}
+        for term in self.terms[bisect_left(self.terms, word):]:
+            if not term.startswith(word):
+                break
+            for recipe_id, score in self.postings[term].items():
+                result[recipe_id] = max(result.get(recipe_id, 0), score)
+        return result
+
+    def search(self, query):
+        """{id рецепта: релевантность}."""
+        ranks = None
+        for word in tokenize(query):
+            matches = self.matches(word)
+            if ranks is not None:
+                matches = {
+                    recipe_id: ranks[recipe_id] + score
+                    for recipe_id, score in matches.items()
+                    if recipe_id in ranks
+                }
+            ranks = matches
+            if not ranks:
+                break
+        return ranks or {}
+
+
+def get_index():
+    global _index
+    version = cache.get_version('search')
+    if _index is None or _index[0] != version:
+        documents = defaultdict(list)
+        for recipe_id, name, text in Recipe.objects.values_list(
+                'id', 'name', 'text'):
+            documents[recipe_id] += [(name, 'A'), (text, 'C')]
+        for recipe_id, name in IngredientAmount.objects.values_list(
+                'recipe_id', 'ingredient__name'):
+            documents[recipe_id].append((name, 'B'))
+        _index = (version, InvertedIndex(documents))
+    return _index[1]
+
+
+def search(queryset, query):
+    """Рецепты queryset, содержащие все слова query (по началу слова),
+    по убыванию релевантности (аннотация search_rank)."""
+    words = tokenize(query)
+    if not words:
+        return queryset
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(
+            ' & '.join(f'{word}:*' for word in words),
+            config=settings.SEARCH_CONFIG, search_type='raw')
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by(*ORDERING)
+    ranks = get_index().search(query)
+    if not ranks:
+        return queryset.none()
+    return queryset.filter(pk__in=list(ranks)).annotate(search_rank=Case(
+        *(When(pk=pk, then=Value(rank)) for pk, rank in ranks.items()),
+        output_field=FloatField()
+    )).order_by(*ORDERING)
@@ -1,10 +1,11 @@
 # from django.shortcuts import get_object_or_404
-from django.db import transaction
+from django.db import models, transaction
 from drf_base64.fields import Base64ImageField
 from rest_framework import serializers
 
-from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
-                            ShoppingCart, Tag)
+from recipes import (cook, fragments, images, response_cache, search,
+                     shopping_list)
+from recipes.models import Ingredient, IngredientAmount, Recipe, Tag
 from recipes.validators import validate_ingredients, validate_tags
 from users.serializers import CustomUserSerializer
 
@@ -40,21 +41,49 @@ class IngredientAmountSerializer(serializers.ModelSerializer):
 
 class SmallRecipeSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
+    def get_image_variants(self, obj):
+        return images.variant_urls(obj, self.context.get('request'))
+
+
+class UserFlagField(serializers.ReadOnlyField):
+    """Флаг, зависящий от пользователя. Во фрагмент рецепта попадает
+    как False, значение подставляет recipes.fragments.render."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return False
+
+
+class AuthorSerializer(CustomUserSerializer):
+    """Автор во фрагменте рецепта."""
+    is_subscribed = UserFlagField()
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, models.Manager) else data
+        return fragments.render(list(recipes), self.child)
+
 
 class RecipeSerializer(serializers.ModelSerializer):
-    author = CustomUserSerializer(read_only=True)
+    author = AuthorSerializer(read_only=True)
     tags = TagSerializer(read_only=True, many=True)
     ingredients = IngredientAmountSerializer(
         read_only=True, many=True, source='ingredientamount_set')
     image = Base64ImageField()
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
+    is_favorited = UserFlagField()
+    is_in_shopping_cart = UserFlagField()
 
     class Meta:
         model = Recipe
@@ -62,6 +91,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_variants',
             'text',
             'tags',
             'author',
@@ -70,98 +100,169 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'cooking_time'
         )
+        list_serializer_class = RecipeListSerializer
 
-    def get_is_favorited(self, obj):
-        """Проверяет, является ли рецепт избранным
-        для пользователя, который отправил запрос."""
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            user_id = request.user.id
-            return Favorite.objects.filter(
-                user=user_id, recipe=obj.id).exists()
-        return False
+    def to_representation(self, instance):
+        """Фрагмент рецепта из кэша с флагами is_favorited,
+        is_in_shopping_cart и is_subscribed пользователя, который
+        отправил запрос."""
+        return fragments.render([instance], self)[0]
 
-    def get_is_in_shopping_cart(self, obj):
-        """Проверяет, есть ли рецепт в корзине
-        покупок пользователя, который отправил запрос."""
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            user_id = request.user.id
-            return ShoppingCart.objects.filter(
-                user=user_id, recipe=obj.id).exists()
-        return False
+    def fragment(self, instance):
+        """Представление рецепта, не зависящее от пользователя."""
+        return super().to_representation(instance)
+
+    def get_image_variants(self, obj):
+        """Адреса уменьшенных копий картинки (small, medium) в форматах
+        webp и jpeg; None, пока картинка не обработана."""
+        return images.variant_urls(obj, self.context.get('request'))
 
     def create_ingredient_amount(self, valid_ingredients, recipe):
         """Создает записи в модели IngredientAmount
         для указанного количества ингредиентов."""
-        ingredient_ids = [
-            ingredient_data.get('id') for ingredient_data in valid_ingredients
-        ]
-        ingredients = Ingredient.objects.filter(id__in=ingredient_ids)
-        ingredient_amounts = []
-        for ingredient_data in valid_ingredients:
-            ingredient = ingredients.get(id=ingredient_data.get('id'))
-            ingredient_amounts.append(
-                IngredientAmount(
-                    recipe=recipe,
-                    ingredient=ingredient,
-                    amount=ingredient_data.get('amount')
-                )
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(
+                recipe=recipe,
+                ingredient=ingredient_data['ingredient'],
+                amount=ingredient_data['amount']
             )
-        IngredientAmount.objects.bulk_create(ingredient_amounts)
-
-    def create_tags(self, data, recipe):
-        """Отправка на валидацию и создание тэгов у рецепта."""
-        valid_tags = validate_tags(data.get('tags'))
-        tags = Tag.objects.get_queryset().filter(id__in=valid_tags)
-        recipe.tags.set(tags)
+            for ingredient_data in valid_ingredients
+        )
 
     @transaction.atomic
     def create(self, validated_data):
         """Создание рецепта"""
         valid_ingredients = validated_data.pop('ingredients')
-        tags_data = self.initial_data.get('tags', [])
-        with transaction.atomic():
-            recipe = Recipe.objects.create(**validated_data)
-            self.create_tags({'tags': tags_data}, recipe)
-            ingredient_ids = [
-                ingredient_data.get(
-                    'id') for ingredient_data in valid_ingredients
-            ]
-            ingredients = Ingredient.objects.filter(id__in=ingredient_ids)
-            ingredient_amounts = [
-                IngredientAmount(
-                    recipe=recipe,
-                    ingredient=ingredients.get(id=ingredient_data.get('id')),
-                    amount=ingredient_data.get('amount')
-                )
-                for ingredient_data in valid_ingredients
-            ]
-            IngredientAmount.objects.bulk_create(ingredient_amounts)
+        tags = validated_data.pop('tags')
+        recipe = Recipe.objects.create(**validated_data)
+        recipe.tags.set(tags)
+        self.create_ingredient_amount(valid_ingredients, recipe)
+        search.update_vectors([recipe.pk])
+        cook.recipes_changed([recipe.pk])
+        images.schedule([recipe])
         return recipe
 
     def validate(self, data):
-        """Валидация данных."""
-        ingredients = self.initial_data.get('ingredients')
-        valid_ingredients = validate_ingredients(ingredients)
-        data['ingredients'] = valid_ingredients
+        """Валидация данных. Тэги и ингредиенты проверяются
+        и загружаются из БД одним запросом на каждый список."""
+        data['ingredients'] = validate_ingredients(
+            self.initial_data.get('ingredients'))
+        tags_data = self.initial_data.get('tags')
+        if tags_data or self.instance is None:
+            data['tags'] = validate_tags(tags_data)
         return data
 
+    def update_tags(self, recipe, tags):
+        """Добавляет и удаляет только изменившиеся связи с тэгами."""
+        current = set(recipe.tags.values_list('id', flat=True))
+        new = {tag.id for tag in tags}
+        if current - new:
+            recipe.tags.remove(*(current - new))
+        if new - current:
+            recipe.tags.add(*(new - current))
+
+    def update_ingredient_amounts(self, recipe, valid_ingredients):
+        """Применяет к IngredientAmount только разницу между текущими
+        и новыми ингредиентами. Возвращает старые и новые количества."""
+        current = {
+            amount.ingredient_id: amount
+            for amount in recipe.ingredientamount_set.all()
+        }
+        old_amounts = {
+            ingredient_id: amount.amount
+            for ingredient_id, amount in current.items()
+        }
+        new_amounts = {
+            ingredient_data['ingredient'].id: ingredient_data['amount']
+            for ingredient_data in valid_ingredients
+        }
+        to_update = []
+        for ingredient_id in current.keys() & new_amounts.keys():
+            amount = current[ingredient_id]
+            if amount.amount != new_amounts[ingredient_id]:
+                amount.amount = new_amounts[ingredient_id]
+                to_update.append(amount)
+        removed = current.keys() - new_amounts.keys()
+        if removed:
+            IngredientAmount.objects.filter(
+                pk__in=[current[ingredient_id].pk for ingredient_id in removed]
+            ).delete()
+        if to_update:
+            IngredientAmount.objects.bulk_update(to_update, ['amount'])
+        self.create_ingredient_amount(
+            (ingredient_data for ingredient_data in valid_ingredients
+             if ingredient_data['ingredient'].id not in current),
+            recipe
+        )
+        return old_amounts, new_amounts
+
+    def same_image(self, recipe, image):
+        """Совпадает ли загруженная картинка с текущей картинкой
+        рецепта (имя в хранилище - хэш содержимого)."""
+        field = recipe.image.field
+        name = field.generate_filename(recipe, image.name)
+        return recipe.image.name == field.storage.hashed_name(name, image)
+
     @transaction.atomic
     def update(self, instance, validated_data):
-        """Изменение рецепта"""
-        instance.name = validated_data.get('name', instance.name)
-        instance.image = validated_data.get('image', instance.image)
-        instance.text = validated_data.get('text', instance.text)
-        instance.cooking_time = validated_data.get(
-            'cooking_time', instance.cooking_time)
-        instance.save()
-        tags_data = self.initial_data.get('tags', [])
-        if tags_data:
-            instance.tags.remove()
-            self.create_tags({'tags': tags_data}, instance)
-        instance.ingredientamount_set.filter(recipe__in=[instance.id]).delete()
-        valid_ingredients = validated_data.get(
-            'ingredients', instance.ingredients)
-        self.create_ingredient_amount(valid_ingredients, instance)
+        """Изменение рецепта. Записываются только изменившиеся
+        поля, связи с тэгами и количества ингредиентов."""
+        if 'image' in validated_data and self.same_image(
+                instance, validated_data['image']):
+            validated_data.pop('image')
+        changed_fields = []
+        for field in ('name', 'image', 'text', 'cooking_time'):
+            if field in validated_data and (
+                    getattr(instance, field) != validated_data[field]):
+                setattr(instance, field, validated_data[field])
+                changed_fields.append(field)
+        if 'image' in changed_fields:
+            # Старые варианты не подходят к новой картинке.
+            instance.image_hash = ''
+            changed_fields.append('image_hash')
+            images.schedule([instance])
+        if changed_fields:
+            instance.save(update_fields=changed_fields)
+        if 'tags' in validated_data:
+            self.update_tags(instance, validated_data['tags'])
+        old_amounts, new_amounts = self.update_ingredient_amounts(
+            instance, validated_data['ingredients'])
+        # Удаленные количества вычитаются из списков покупок
+        # по сигналу post_delete, остальные записаны без сигналов.
+        shopping_list.update_recipe(instance.pk, {
+            ingredient_id: amount
+            for ingredient_id, amount in old_amounts.items()
+            if ingredient_id in new_amounts
+        }, new_amounts)
+        # Состав ингредиентов входит в поисковый вектор и в индекс
+        # подбора; название и описание - по сигналу post_save.
+        if old_amounts.keys() != new_amounts.keys():
+            search.update_vectors([instance.pk])
+            cook.recipes_changed([instance.pk])
+        # Связи и ингредиенты меняются без сигналов post_save.
+        response_cache.purge_recipes([instance.pk])
         return instance
+
+
+class BulkRecipeSerializer(serializers.ModelSerializer):
+    """Элемент пакетного импорта рецептов.
+
+    Тэги и ингредиенты сверяются со словарями из контекста
+    (known_tags, known_ingredients), загруженными один раз на весь пакет.
+    """
+    image = Base64ImageField()
+    tags = serializers.ListField()
+    ingredients = serializers.ListField(child=serializers.DictField())
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'name', 'image', 'text', 'cooking_time', 'tags', 'ingredients'
+        )
+
+    def validate(self, data):
+        data['tags'] = validate_tags(
+            data.get('tags'), self.context['known_tags'])
+        data['ingredients'] = validate_ingredients(
+            data.get('ingredients'), self.context['known_ingredients'])
+        return data
@@ -0,0 +1,172 @@
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import F, Sum
+
+from recipes import cache
+from recipes.models import IngredientAmount, ShoppingCart, ShoppingListItem
+
+DOCUMENT_KEY = 'shopping_list_document:{}:{}:{}'
+
+
+def version_name(user_id):
+    return f'shopping_list:{user_id}'
+
+
+def get_version(user):
+    """Версия списка покупок пользователя. Учитывает и версию
+    справочника ингредиентов, так как в документе их названия."""
+    return '{}-{}'.format(
+        cache.get_version(version_name(user.id)),
+        cache.get_version('ingredients'),
+    )
+
+
+def bump_versions(user_ids):
+    cache.bump_versions(version_name(user_id) for user_id in user_ids)
+
+
+def document_key(user, version, extension):
+    return DOCUMENT_KEY.format(user.id, version, extension)
+
+
+def recipe_amounts(recipe):
+    """Количества ингредиентов рецепта: {ingredient_id: amount}."""
+    return dict(IngredientAmount.objects.filter(
+        recipe=recipe).values_list('ingredient_id', 'amount'))
+
+
+def amounts_delta(old_amounts, new_amounts):
+    """Разница между двумя наборами количеств ингредиентов."""
+    delta = Counter(new_amounts)
+    delta.subtract(old_amounts)
+    return {
+        ingredient_id: amount
+        for ingredient_id, amount in delta.items() if amount
+    }
+
+
+@transaction.atomic
+def apply_delta(user_ids, delta):
+    """Применяет изменения количеств к спискам покупок пользователей."""
+    if not user_ids or not delta:
+        return
+    items = ShoppingListItem.objects.select_for_update().filter(
+        user__in=user_ids, ingredient__in=list(delta))
+    existing = {(item.user_id, item.ingredient_id): item for item in items}
+    to_create, to_update, to_delete = [], [], []
+    for user_id in user_ids:
+        for ingredient_id, amount in delta.items():
+            item = existing.get((user_id, ingredient_id))
+            if item is None:
+                if amount > 0:
+                    to_create.append(ShoppingListItem(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=amount
+                    ))
+            elif item.amount + amount > 0:
+                item.amount += amount
+                to_update.append(item)
+            else:
+                to_delete.append(item.pk)
+    ShoppingListItem.objects.bulk_create(to_create)
+    ShoppingListItem.objects.bulk_update(to_update, ['amount'])
+    ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+    bump_versions(user_ids)
+
+
+def cart_user_ids(recipe):
+    return list(ShoppingCart.objects.filter(
+        recipe=recipe).values_list('user_id', flat=True))
+
+
+def deleting_recipes():
+    """Рецепты, которые удаляются в текущем соединении: их корзины
+    и ингредиенты удаляются каскадом, а списки покупок уже исправлены
+    по сигналу pre_delete рецепта."""
+    deleting = getattr(connection, 'deleting_shopping_recipes', None)
+    if deleting is None:
+        deleting = connection.deleting_shopping_recipes = set()
+    return deleting
+
+
+def add_recipe(user_id, recipe_id):
+    """Рецепт добавлен в корзину пользователя."""
+    apply_delta([user_id], recipe_amounts(recipe_id))
+
+
+def remove_recipe(user_id, recipe_id):
+    """Рецепт удален из корзины пользователя."""
+    if recipe_id not in deleting_recipes():
+        apply_delta(
+            [user_id], amounts_delta(recipe_amounts(recipe_id), {}))
+
+
+def update_recipe(recipe_id, old_amounts, new_amounts):
+    """Ингредиенты рецепта изменены: обновляет списки покупок
+    всех пользователей, у которых рецепт в корзине."""
+    if recipe_id in deleting_recipes():
+        return
+    delta = amounts_delta(old_amounts, new_amounts)
+    if delta:
+        apply_delta(cart_user_ids(recipe_id), delta)
+
+
+def delete_recipe(recipe_id):
+    """Рецепт удаляется: убирает его из списков покупок до того,
+    как каскадом удалятся корзины и ингредиенты."""
+    apply_delta(
+        cart_user_ids(recipe_id),
+        amounts_delta(recipe_amounts(recipe_id), {}))
+    deleting_recipes().add(recipe_id)
+
+
+def recipe_deleted(recipe_id):
+    deleting_recipes().discard(recipe_id)
+
+
+def update_amount(old, new):
+    """Запись IngredientAmount изменена, например в админке.
+    old и new - (recipe_id, ingredient_id, amount) до и после."""
+    if old is not None and old[0] != new[0]:
+        update_recipe(old[0], {old[1]: old[2]}, {})
+        old = None
+    update_recipe(
+        new[0], {old[1]: old[2]} if old else {}, {new[1]: new[2]})
+
+
+@transaction.atomic
+def rebuild(user):
+    """Пересчитывает список покупок пользователя по корзине."""
+    ShoppingListItem.objects.filter(user=user).delete()
+    totals = IngredientAmount.objects.filter(
+        recipe__sh_cart__user=user).values('ingredient').annotate(
+            total=Sum('amount'))
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(
+            user=user,
+            ingredient_id=row['ingredient'],
+            amount=row['total']
+        )
+        for row in totals
+    )
+    bump_versions([user.id])
+
+
+def ensure_built(user):
+    """Строит список покупок, если корзина есть, а списка нет:
+    корзины, собранные до появления сводных списков, пересчитываются
+    при первом скачивании."""
+    if (not ShoppingListItem.objects.filter(user=user).exists()
+            and ShoppingCart.objects.filter(user=user).exists()):
+        rebuild(user)
+
+
+def get_items(user):
+    """Список покупок пользователя для рендереров."""
+    return ShoppingListItem.objects.filter(user=user).values(
+        name=F('ingredient__name'),
+        measurement_unit=F('ingredient__measurement_unit'),
+        total=F('amount'),
+    ).order_by('name')
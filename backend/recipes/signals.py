@@ -0,0 +1,116 @@
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from recipes import cache, response_cache, search, shopping_list
+from recipes.models import (Ingredient, IngredientAmount, Recipe,
+                            ShoppingCart, Tag)
+from users.models import User
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_tags(**kwargs):
+    """Сбрасывает кэш справочника тэгов, в том числе после
+    правок через list_editable в админке."""
+    cache.bump_versions(['tags'])
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    """Сбрасывает кэш справочника ингредиентов."""
+    cache.bump_versions(['ingredients'])
+
+
+@receiver(post_save, sender=Ingredient)
+def update_search_vectors(instance, created, **kwargs):
+    """Название ингредиента входит в поисковые векторы рецептов."""
+    if not created:
+        search.update_vectors(IngredientAmount.objects.filter(
+            ingredient=instance).values_list('recipe', flat=True))
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_vector(instance, update_fields=None, **kwargs):
+    """Название и описание входят в поисковый вектор, в том числе
+    после правок в админке."""
+    if update_fields is None or {'name', 'text'} & set(update_fields):
+        search.update_vectors([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=IngredientAmount)
+def update_ingredients_vector(instance, **kwargs):
+    """Ингредиенты рецепта входят в его поисковый вектор
+    (инлайн ингредиентов в админке)."""
+    search.update_vectors([instance.recipe_id])
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def purge_recipe_responses(instance, **kwargs):
+    """Сбрасывает закэшированные ответы с рецептом, в том числе
+    после правок в админке и удаления вместе с автором."""
+    response_cache.purge_recipes([instance.pk], [instance.author_id])
+
+
+@receiver([post_save, post_delete], sender=IngredientAmount)
+def purge_ingredients_responses(instance, **kwargs):
+    """Ингредиенты входят в ответы и фрагменты рецепта; в админке
+    они меняются без сохранения самого рецепта."""
+    response_cache.purge_recipes([instance.recipe_id])
+
+
+@receiver(post_save, sender=User)
+def purge_user_responses(instance, update_fields=None, **kwargs):
+    """Автор входит в ответы со своими рецептами."""
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        response_cache.purge([response_cache.user_key(instance.pk)])
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(instance, created, **kwargs):
+    """Сводный список покупок обновляется при любом добавлении
+    в корзину, в том числе в админке."""
+    if created:
+        shopping_list.add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_from_shopping_list(instance, **kwargs):
+    """И при любом удалении из корзины, в том числе каскадном
+    вместе с пользователем."""
+    shopping_list.remove_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(instance, **kwargs):
+    """Пока корзины и ингредиенты рецепта не удалены каскадом."""
+    shopping_list.delete_recipe(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_deleted_recipe(instance, **kwargs):
+    shopping_list.recipe_deleted(instance.pk)
+
+
+@receiver(pre_save, sender=IngredientAmount)
+def remember_saved_amount(instance, **kwargs):
+    """Прежние рецепт, ингредиент и количество записи
+    для обновления списков покупок."""
+    instance.saved_amount = None
+    if instance.pk is not None:
+        instance.saved_amount = IngredientAmount.objects.filter(
+            pk=instance.pk).values_list(
+                'recipe_id', 'ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=IngredientAmount)
+def update_shopping_lists(instance, **kwargs):
+    shopping_list.update_amount(
+        instance.saved_amount,
+        (instance.recipe_id, instance.ingredient_id, instance.amount)
+    )
+
+
+@receiver(post_delete, sender=IngredientAmount)
+def subtract_from_shopping_lists(instance, **kwargs):
+    shopping_list.update_recipe(
+        instance.recipe_id, {instance.ingredient_id: instance.amount}, {})
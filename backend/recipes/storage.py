@@ -0,0 +1,33 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла - sha256 его содержимого.
+
+    Повторная загрузка того же файла не создает копию, а возвращает
+    имя уже сохраненного. Файлы, на которые больше не ссылается ни один
+    рецепт, удаляет команда collect_media_garbage.
+    """
+
+    def hashed_name(self, name, content):
+        """Имя файла в каталоге name: <hash[:2]>/<hash><расширение>."""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory, filename = posixpath.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            # Свежая отметка времени защищает файл от сборки мусора.
+            os.utime(self.path(name))
+            return name
+        return super()._save(name, content)
@@ -0,0 +1,470 @@
+import base64
+import csv
+import os
+import random
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+
+from recipes import cook, shopping_list
+from recipes.autocomplete import IngredientIndex
+from recipes.models import (Ingredient, IngredientAmount, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
+from users.models import Subscription, User
+
+
+class RecipeListQueriesTest(TestCase):
+    """Число запросов к БД при выдаче списка рецептов не зависит
+    от размера страницы."""
+    # Пустой кэш: количество, страница, рецепты страницы с автором,
+    # тэгами и ингредиентами (recipes.fragments), флаги пользователя.
+    COLD_QUERIES = 7
+    # Количество и фрагменты из кэша: страница и флаги пользователя.
+    WARM_QUERIES = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        authors = [
+            User.objects.create_user(
+                username=f'author{index}',
+                email=f'author{index}@example.com',
+                password='pass'
+            )
+            for index in range(3)
+        ]
+        Subscription.objects.create(user=cls.reader, author=authors[0])
+        tags = [
+            Tag.objects.create(
+                name=f'Тэг {index}', color=f'#00000{index}',
+                slug=f'tag{index}')
+            for index in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {index}', measurement_unit='г')
+            for index in range(3)
+        ]
+        for index in range(12):
+            recipe = Recipe.objects.create(
+                author=authors[index % len(authors)],
+                name=f'Рецепт {index}',
+                image='recipes/image.png',
+                text='Описание',
+                cooking_time=10,
+            )
+            recipe.tags.set(tags)
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(
+                    recipe=recipe, ingredient=ingredient, amount=index + 1)
+                for ingredient in ingredients
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def get_list(self, limit, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.get('/api/recipes/', {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+        return response
+
+    def test_cold_cache(self):
+        for limit in (2, 10):
+            with self.subTest(limit=limit):
+                cache.clear()
+                self.get_list(limit, self.COLD_QUERIES)
+
+    def test_warm_cache(self):
+        for limit in (2, 10):
+            with self.subTest(limit=limit):
+                cache.clear()
+                cold = self.get_list(limit, self.COLD_QUERIES)
+                warm = self.get_list(limit, self.WARM_QUERIES)
+                self.assertEqual(
+                    cold.data['results'], warm.data['results'])
+
+    def test_user_flags(self):
+        response = self.get_list(10, self.COLD_QUERIES)
+        subscribed = {
+            recipe['author']['username']: recipe['author']['is_subscribed']
+            for recipe in response.data['results']
+        }
+        self.assertEqual(subscribed, {
+            'author0': True, 'author1': False, 'author2': False})
+
+
+class KeysetPaginationTest(TestCase):
+    """Пагинация по ключу проходит строки с одинаковыми значениями
+    полей сортировки без пропусков и повторов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        for index in range(11):
+            Recipe.objects.create(
+                author=cls.user,
+                name=f'Рецепт {index}',
+                image='recipes/image.png',
+                text='Описание',
+                cooking_time=10,
+                favorites_count=index % 3,
+            )
+        # Одинаковая дата публикации у всех рецептов, кроме первого.
+        first = Recipe.objects.order_by('id').first()
+        Recipe.objects.exclude(pk=first.pk).update(
+            pub_date=first.pub_date)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def pages(self, params):
+        ids = []
+        response = self.client.get('/api/recipes/', {**params, 'cursor': ''})
+        for _ in range(Recipe.objects.count() + 1):
+            self.assertEqual(response.status_code, 200)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            if response.data['next'] is None:
+                return ids
+            response = self.client.get(response.data['next'])
+        self.fail(f'Курсор не продвигается: {ids}')
+
+    def test_tied_rows(self):
+        cases = {
+            '': ('-pub_date', '-id'),
+            'popular': ('-favorites_count', '-pub_date', '-id'),
+        }
+        for ordering, fields in cases.items():
+            expected = list(Recipe.objects.order_by(
+                *fields).values_list('id', flat=True))
+            for limit in (1, 2, 4):
+                with self.subTest(ordering=ordering, limit=limit):
+                    ids = self.pages({'ordering': ordering, 'limit': limit})
+                    self.assertEqual(ids, expected)
+
+    def test_invalid_cursor(self):
+        def encode(value):
+            return base64.urlsafe_b64encode(value.encode()).decode()
+
+        for cursor in ('!!!', encode('не json'), encode('[1]'),
+                       encode('["вчера", "x"]'), encode('{"a": 1, "b": 2}'),
+                       encode('[[1], [2]]')):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(
+                    '/api/recipes/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+
+
+class ShoppingListSummaryTest(TestCase):
+    """Сводный список покупок после любых изменений корзин
+    и рецептов совпадает с пересчитанным заново."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{index}',
+                email=f'author{index}@example.com',
+                password='pass'
+            )
+            for index in range(2)
+        ]
+        cls.buyers = [
+            User.objects.create_user(
+                username=f'buyer{index}',
+                email=f'buyer{index}@example.com',
+                password='pass'
+            )
+            for index in range(2)
+        ]
+        cls.tag = Tag.objects.create(name='Тэг', color='#000000', slug='tag')
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {index}', measurement_unit='г')
+            for index in range(3)
+        ]
+        cls.recipes = []
+        for author, amounts in (
+                (0, {0: 10, 1: 5}), (1, {0: 3, 2: 7}), (0, {1: 2})):
+            recipe = Recipe.objects.create(
+                author=cls.authors[author],
+                name=f'Рецепт {len(cls.recipes)}',
+                image='recipes/image.png',
+                text='Описание',
+                cooking_time=10,
+            )
+            recipe.tags.set([cls.tag])
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(
+                    recipe=recipe,
+                    ingredient=cls.ingredients[index],
+                    amount=amount
+                )
+                for index, amount in amounts.items()
+            )
+            cls.recipes.append(recipe)
+        for user, recipe in ((cls.buyers[0], 0), (cls.buyers[0], 1),
+                             (cls.buyers[1], 0), (cls.buyers[1], 2),
+                             (cls.authors[1], 0)):
+            ShoppingCart.objects.create(
+                user=user, recipe=cls.recipes[recipe])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def summary(self, user):
+        return dict(ShoppingListItem.objects.filter(
+            user=user).values_list('ingredient__name', 'amount'))
+
+    def assertMatchesRebuild(self):
+        for user in User.objects.all():
+            with self.subTest(user=user.username):
+                summary = self.summary(user)
+                shopping_list.rebuild(user)
+                self.assertEqual(summary, self.summary(user))
+        self.assertFalse(shopping_list.deleting_recipes())
+
+    def test_initial(self):
+        self.assertEqual(self.summary(self.buyers[0]), {
+            'ингредиент 0': 13, 'ингредиент 1': 5, 'ингредиент 2': 7})
+        self.assertMatchesRebuild()
+
+    def test_api_cart(self):
+        self.client.force_authenticate(self.buyers[0])
+        url = '/api/recipes/{}/shopping_cart/'
+        response = self.client.post(url.format(self.recipes[2].pk))
+        self.assertEqual(response.status_code, 201)
+        response = self.client.delete(url.format(self.recipes[0].pk))
+        self.assertEqual(response.status_code, 204)
+        self.assertMatchesRebuild()
+
+    def test_api_update(self):
+        self.client.force_authenticate(self.authors[0])
+        response = self.client.patch(
+            f'/api/recipes/{self.recipes[0].pk}/',
+            {'ingredients': [
+                {'id': self.ingredients[0].pk, 'amount': 4},
+                {'id': self.ingredients[2].pk, 'amount': 1},
+            ]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertMatchesRebuild()
+
+    def test_api_delete(self):
+        self.client.force_authenticate(self.authors[0])
+        response = self.client.delete(f'/api/recipes/{self.recipes[0].pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertMatchesRebuild()
+
+    def test_amount_edits(self):
+        amount = IngredientAmount.objects.get(
+            recipe=self.recipes[0], ingredient=self.ingredients[0])
+        amount.amount = 1
+        amount.save()
+        amount.recipe = self.recipes[2]
+        amount.save()
+        IngredientAmount.objects.create(
+            recipe=self.recipes[1], ingredient=self.ingredients[1], amount=6)
+        IngredientAmount.objects.filter(
+            recipe=self.recipes[1], ingredient=self.ingredients[2]).delete()
+        self.assertMatchesRebuild()
+
+    def test_cart_rows_deleted(self):
+        ShoppingCart.objects.filter(recipe=self.recipes[0]).delete()
+        self.assertMatchesRebuild()
+
+    def test_recipe_deleted(self):
+        Recipe.objects.get(pk=self.recipes[1].pk).delete()
+        self.assertMatchesRebuild()
+
+    def test_author_deleted(self):
+        User.objects.get(pk=self.authors[0].pk).delete()
+        self.assertEqual(self.summary(self.buyers[1]), {})
+        self.assertMatchesRebuild()
+
+    def test_buyer_and_author_deleted(self):
+        User.objects.get(pk=self.buyers[0].pk).delete()
+        User.objects.get(pk=self.authors[1].pk).delete()
+        self.assertMatchesRebuild()
+
+
+class RecountCountersTest(TransactionTestCase):
+    """recount_counters сбрасывает закэшированные ответы
+    с исправленными счетчиками (сброс - после фиксации транзакции)."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.recipe = Recipe.objects.create(
+            author=self.author,
+            name='Рецепт',
+            image='recipes/image.png',
+            text='Описание',
+            cooking_time=10,
+        )
+        User.objects.filter(pk=self.author.pk).update(
+            recipes_count=5, followers_count=3)
+
+    def get_author(self):
+        response = APIClient().get(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 200)
+        return response.data['author']
+
+    def test_api_shows_repaired_counts(self):
+        self.assertEqual(self.get_author()['recipes_count'], 5)
+        call_command('recount_counters', stdout=StringIO())
+        author = self.get_author()
+        self.assertEqual(author['recipes_count'], 1)
+        self.assertEqual(author['followers_count'], 0)
+
+
+class CookIndexTest(SimpleTestCase):
+    """Подбор по битовым маскам совпадает с перебором рецептов."""
+
+    def brute_force(self, recipes, include, exclude, limit):
+        result = []
+        for recipe_id, ingredient_ids in recipes.items():
+            if not ingredient_ids or ingredient_ids & exclude:
+                continue
+            matched = len(ingredient_ids & include)
+            if include and not matched:
+                continue
+            result.append((recipe_id, matched, len(ingredient_ids)))
+        if include:
+            result.sort(key=lambda item: (
+                -item[1] / item[2], item[2] - item[1], -item[0]))
+        else:
+            result.sort(key=lambda item: -item[0])
+        return result[:limit]
+
+    def assertMatchesBruteForce(self, index, recipes, generator):
+        for _ in range(200):
+            include = set(generator.sample(range(12), generator.randint(0, 5)))
+            exclude = set(generator.sample(range(12), generator.randint(0, 2)))
+            limit = generator.choice([None, 1, 5, 20])
+            with self.subTest(include=include, exclude=exclude, limit=limit):
+                self.assertEqual(
+                    index.search(include, exclude, limit),
+                    self.brute_force(recipes, include, exclude, limit))
+
+    def test_search(self):
+        generator = random.Random(1)
+        recipes = {
+            recipe_id: set(
+                generator.sample(range(12), generator.randint(1, 6)))
+            for recipe_id in range(1, 150)
+        }
+        index = cook.CookIndex(
+            (recipe_id, ingredient_id)
+            for recipe_id, ingredient_ids in recipes.items()
+            for ingredient_id in ingredient_ids
+        )
+        self.assertMatchesBruteForce(index, recipes, generator)
+        # Изменение, удаление и добавление рецептов (новые id больше).
+        for recipe_id in generator.sample(range(1, 150), 40):
+            recipes[recipe_id] = set(
+                generator.sample(range(12), generator.randint(0, 6)))
+            index.update(recipe_id, recipes[recipe_id])
+        for recipe_id in range(150, 170):
+            recipes[recipe_id] = set(
+                generator.sample(range(12), generator.randint(1, 6)))
+            index.update(recipe_id, recipes[recipe_id])
+        self.assertMatchesBruteForce(index, recipes, generator)
+
+
+class CookIndexInvalidationTest(TransactionTestCase):
+    """Индекс процесса обновляется после recipes_changed, а индексы
+    других процессов перестраиваются по новой версии."""
+
+    def setUp(self):
+        cache.clear()
+        cook._index = None
+        self.addCleanup(setattr, cook, '_index', None)
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {index}', measurement_unit='г')
+            for index in range(2)
+        ]
+        self.recipe = Recipe.objects.create(
+            author=author,
+            name='Рецепт',
+            image='recipes/image.png',
+            text='Описание',
+            cooking_time=10,
+        )
+        IngredientAmount.objects.create(
+            recipe=self.recipe, ingredient=self.ingredients[0], amount=1)
+
+    def found(self, ingredient):
+        return [
+            recipe_id
+            for recipe_id, _, _ in cook.get_index().search([ingredient.pk])
+        ]
+
+    def test_recipes_changed(self):
+        self.assertEqual(self.found(self.ingredients[1]), [])
+        stale = cook._index
+        IngredientAmount.objects.filter(recipe=self.recipe).update(
+            ingredient=self.ingredients[1])
+        cook.recipes_changed([self.recipe.pk])
+        self.assertEqual(self.found(self.ingredients[0]), [])
+        self.assertEqual(self.found(self.ingredients[1]), [self.recipe.pk])
+        # Другой процесс с индексом, построенным до изменения.
+        cook._index = (stale[0], stale[1], cook.CookIndex(
+            [(self.recipe.pk, self.ingredients[0].pk)]))
+        self.assertEqual(self.found(self.ingredients[1]), [self.recipe.pk])
+
+
+class FuzzyIngredientSearchTest(SimpleTestCase):
+    """Поиск с опечатками по справочнику ingredients.csv."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        path = os.path.join(settings.BASE_DIR, 'ingredients.csv')
+        with open(path, encoding='utf-8') as file:
+            cls.index = IngredientIndex(
+                {'id': i, 'name': name, 'measurement_unit': unit}
+                for i, (name, unit) in enumerate(csv.reader(file), 1)
+            )
+
+    def first(self, query):
+        result = self.index.fuzzy(query, 5)
+        return result[0]['name'] if result else None
+
+    def test_typo_in_partial_word(self):
+        cases = {
+            'помад': 'помидоры',
+            'малок': 'молоко',
+            'кортоф': 'картофель',
+        }
+        for query, name in cases.items():
+            with self.subTest(query=query):
+                self.assertEqual(self.first(query), name)
+
+    def test_typo_in_whole_word(self):
+        for query, name in {'сахр': 'сахар', 'чесног': 'чеснок'}.items():
+            with self.subTest(query=query):
+                self.assertEqual(self.first(query), name)
+
+    def test_prefix_first(self):
+        self.assertEqual(self.first('помид'), 'помидоры')
+
+    def test_no_match(self):
+        self.assertEqual(self.index.fuzzy('зззз', 5), [])
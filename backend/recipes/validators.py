@@ -1,36 +1,64 @@
 from rest_framework.validators import ValidationError
 
-from recipes.models import Tag
+from recipes.models import Ingredient, Tag
 
 
-def validate_tags(data):
-    """Валидация тэгов."""
+def to_ints(values, field, message='Идентификаторы должны быть числами.'):
+    """Приводит значения к int."""
+    try:
+        return [int(value) for value in values]
+    except (TypeError, ValueError):
+        raise ValidationError({field: [message]})
+
+
+def validate_tags(data, known=None):
+    """Валидация тэгов. Все тэги загружаются одним запросом
+    и возвращаются вместо идентификаторов. Если передан known
+    ({id: Tag}), тэги берутся из него без запроса к БД."""
     if not data:
         raise ValidationError({'tags': ['Обязательное поле.']})
     if len(data) < 1:
         raise ValidationError({'tags': ['Минимум 1 тэг.']})
-    for tag in data:
-        if not Tag.objects.filter(id=tag).exists():
-            raise ValidationError({'tags': ['Тэг отсутствует']})
-    return data
+    ids = set(to_ints(data, 'tags'))
+    if known is None:
+        known = Tag.objects.in_bulk(ids)
+    missing = ids - set(known)
+    if missing:
+        raise ValidationError({'tags': [
+            f'Тэги отсутствуют: {", ".join(map(str, sorted(missing)))}'
+        ]})
+    return [known[id] for id in sorted(ids)]
 
 
-def validate_ingredients(data):
-    """Валидация ингредиентов."""
+def validate_ingredients(data, known=None):
+    """Валидация ингредиентов. Все ингредиенты загружаются одним
+    запросом (или берутся из known - {id: Ingredient}); возвращается
+    список словарей с объектом ингредиента (ingredient)
+    и количеством (amount)."""
     if not data:
         raise ValidationError({'ingredients': ['Обязательное поле.']})
     if len(data) < 1:
         raise ValidationError({'ingredients': ['Не переданы ингредиенты.']})
-    unique_ingredient = []
-    for ingredient in data:
-        id = ingredient.get('id')
-        if id in unique_ingredient:
-            raise ValidationError(
-                {'ingredients': ['Нельзя дублировать названия ингредиентов.']})
-        unique_ingredient.append(id)
-        amount = int(ingredient.get('amount'))
-        if amount < 1:
-            raise ValidationError({'amount': [
-                'Количество не может быть меньше 1.'
-            ]})
-    return data
+    ids = to_ints(
+        (ingredient.get('id') for ingredient in data), 'ingredients')
+    if len(set(ids)) != len(ids):
+        raise ValidationError(
+            {'ingredients': ['Нельзя дублировать названия ингредиентов.']})
+    amounts = to_ints(
+        (ingredient.get('amount') for ingredient in data), 'amount',
+        'Количество должно быть числом.')
+    if min(amounts) < 1:
+        raise ValidationError({'amount': [
+            'Количество не может быть меньше 1.'
+        ]})
+    if known is None:
+        known = Ingredient.objects.in_bulk(ids)
+    missing = set(ids) - set(known)
+    if missing:
+        raise ValidationError({'ingredients': [
+            f'Ингредиенты отсутствуют: {", ".join(map(str, sorted(missing)))}'
+        ]})
+    return [
+        {'ingredient': known[id], 'amount': amount}
+        for id, amount in zip(ids, amounts)
+    ]
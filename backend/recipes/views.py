@@ -1,44 +1,267 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.http import HttpResponseNotModified
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
-from fpdf import FPDF
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from recipes.filters import RecipeFilter
+from api.pagination import (ApproximateCountPagination, KeysetPagination,
+                            LimitPagination)
+from recipes import (autocomplete, bulk, cache, cook, feed, response_cache,
+                     shopping_list)
+from recipes.exporters import RENDERERS, get_renderer
+from recipes.filters import POPULAR_ORDERING, RecipeFilter
 from recipes.ingr_filters import CustomSearchFilter
-from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
-                            ShoppingCart, Tag)
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
 from recipes.permissions import AuthorOrReadOnly
 from recipes.serializers import (IngredientSerializer, RecipeSerializer,
                                  SmallRecipeSerializer, TagSerializer)
+from recipes.validators import to_ints
+from users.models import User
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class ReferenceCacheMixin:
+    """Отдает список справочника из кэша с заголовками HTTP-кэширования.
+
+    Запросы с параметрами (например, поиск) идут мимо кэша.
+    """
+    reference_name = None
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params:
+            return super().list(request, *args, **kwargs)
+        version = cache.get_version(self.reference_name)
+        etag = quote_etag(version)
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(cache.get_reference(
+                self.reference_name, version, self.serialize_reference))
+        response['ETag'] = etag
+        response['Cache-Control'] = (
+            f'public, max-age={settings.REFERENCE_CACHE_MAX_AGE}')
+        return response
+
+    def serialize_reference(self):
+        serializer = self.get_serializer(self.get_queryset(), many=True)
+        return serializer.data
+
+
+class TagViewSet(ReferenceCacheMixin, viewsets.ReadOnlyModelViewSet):
+    reference_name = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReferenceCacheMixin, viewsets.ReadOnlyModelViewSet):
+    reference_name = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     filter_backends = [CustomSearchFilter]
     search_fields = ('^name',)
 
+    def list(self, request, *args, **kwargs):
+        """Список ингредиентов; с параметром name - автодополнение
+        по началу названия, не более limit результатов.
+        С mode=fuzzy - ранжированный поиск по подстроке и с опечатками."""
+        query = request.query_params.get(CustomSearchFilter.search_param)
+        if query is None:
+            return super().list(request, *args, **kwargs)
+        limit = request.query_params.get(
+            'limit', settings.INGREDIENT_AUTOCOMPLETE_LIMIT)
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                return Response(
+                    {'limit': ['Должно быть целым числом.']},
+                    status=status.HTTP_400_BAD_REQUEST)
+            if limit < 1:
+                return Response(
+                    {'limit': ['Должно быть не меньше 1.']},
+                    status=status.HTTP_400_BAD_REQUEST)
+        fuzzy = request.query_params.get('mode') == 'fuzzy'
+        return Response(autocomplete.search(query, limit, fuzzy))
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
+    # Связи загружаются только для рецептов, которых нет в кэше
+    # фрагментов (см. recipes.fragments).
+    queryset = Recipe.objects.defer('search_vector')
     serializer_class = RecipeSerializer
     permission_classes = (AuthorOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filter_class = RecipeFilter
+    pagination_class = ApproximateCountPagination
+
+    @property
+    def cursor_ordering(self):
+        if self.action == 'feed':
+            return feed.ORDERING
+        if self.request.query_params.get('ordering') == 'popular':
+            return POPULAR_ORDERING
+        return ('-pub_date', '-id')
 
+    def list(self, request, *args, **kwargs):
+        keys = [response_cache.RECIPES, *response_cache.REFERENCES]
+        if request.query_params.get('ordering') == 'popular':
+            keys.append(response_cache.FAVORITES)
+        return self.cached_response(
+            request, keys, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_field]
+        if not pk.isdigit():
+            return super().retrieve(request, *args, **kwargs)
+        keys = [response_cache.recipe_key(int(pk)), *response_cache.REFERENCES]
+        return self.cached_response(
+            request, keys, super().retrieve, *args, **kwargs)
+
+    def cached_response(self, request, keys, render, *args, **kwargs):
+        """Ответ анонимному пользователю из кэша ответов.
+
+        keys - суррогатные ключи, от которых зависит ответ; к ним
+        добавляются ключи авторов рецептов из ответа. Ключи отдаются
+        в заголовке Surrogate-Key, чтобы CDN могла сбрасывать ответы
+        по тем же ключам.
+        """
+        if request.user.is_authenticated:
+            return render(request, *args, **kwargs)
+        cached = response_cache.load(request)
+        if cached is not None:
+            data, keys = cached
+            response = Response(data)
+        else:
+            versions = cache.get_versions(keys)
+            response = render(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            recipes = response.data.get('results', [response.data])
+            author_keys = {
+                response_cache.user_key(recipe['author']['id'])
+                for recipe in recipes
+            }
+            # Авторы известны только после построения ответа, но их
+            # версии прочитаны раньше, до построения фрагментов.
+            used = getattr(request, 'fragment_versions', {})
+            versions.update({
+                key: used[key] for key in author_keys if key in used})
+            if author_keys - used.keys():
+                versions.update(
+                    cache.get_versions(author_keys - used.keys()))
+            response_cache.store(request, response.data, versions)
+            keys = list(versions)
+        response['Surrogate-Key'] = response_cache.header(keys)
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        User.objects.filter(pk=self.request.user.pk).update(
+            recipes_count=F('recipes_count') + 1)
+        feed.fan_out(self.request.user, [serializer.instance])
+        self.request.user.refresh_from_db(fields=['recipes_count'])
+
+    @action(
+        methods=['post'],
+        detail=False,
+        url_path='bulk',
+        url_name='bulk',
+        permission_classes=[IsAuthenticated]
+    )
+    def bulk_create(self, request):
+        """Пакетное создание рецептов. Принимает список рецептов
+        и возвращает результат по каждому элементу."""
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'errors': 'Ожидается непустой список рецептов'},
+                status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.BULK_RECIPES_MAX_ITEMS:
+            return Response(
+                {'errors': 'Не более '
+                 f'{settings.BULK_RECIPES_MAX_ITEMS} рецептов за запрос'},
+                status=status.HTTP_400_BAD_REQUEST)
+        results = bulk.import_recipes(request.user, items)
+        created = sum('id' in result for result in results)
+        return Response(
+            {'created': created, 'results': results},
+            status=(status.HTTP_201_CREATED if created
+                    else status.HTTP_400_BAD_REQUEST))
+
+    @action(
+        detail=False,
+        url_path='feed',
+        url_name='feed',
+        permission_classes=[IsAuthenticated]
+    )
+    def feed(self, request):
+        """Рецепты авторов, на которых подписан пользователь, от новых
+        к старым. Пагинация по ключу: следующая страница - по ссылке next."""
+        paginator = KeysetPagination(
+            LimitPagination.page_size, LimitPagination.page_size_query_param)
+        page = paginator.paginate_queryset(
+            feed.get_queryset(request.user), request, self)
+        recipes = Recipe.objects.only('author').in_bulk(
+            [entry.recipe_id for entry in page])
+        serializer = self.get_serializer(
+            [recipes[entry.recipe_id] for entry in page
+             if entry.recipe_id in recipes],
+            many=True
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, url_path='cook', url_name='cook')
+    def cook(self, request):
+        """Подбор рецептов по имеющимся (include) и исключенным
+        (exclude) ингредиентам; id через запятую. Рецепты идут
+        по убыванию доли ингредиентов, которые есть у пользователя."""
+        include = self.get_ingredient_ids(request, 'include')
+        exclude = self.get_ingredient_ids(request, 'exclude')
+        if not include and not exclude:
+            return Response(
+                {'errors': 'Укажите ингредиенты в include или exclude'},
+                status=status.HTTP_400_BAD_REQUEST)
+        ranked = cook.get_index().search(
+            include, exclude, settings.COOK_MAX_RESULTS)
+        paginator = LimitPagination()
+        page = paginator.paginate_queryset(ranked, request)
+        recipes = Recipe.objects.only('author').in_bulk(
+            [recipe_id for recipe_id, _, _ in page])
+        # Индекс может ссылаться на только что удаленные рецепты.
+        page = [item for item in page if item[0] in recipes]
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id, _, _ in page], many=True)
+        data = serializer.data
+        for item, (_, matched, total) in zip(data, page):
+            item['matched_ingredients'] = matched
+            item['missing_ingredients'] = total - matched
+        return paginator.get_paginated_response(data)
+
+    def get_ingredient_ids(self, request, name):
+        values = [
+            value
+            for param in request.query_params.getlist(name)
+            for value in param.split(',') if value
+        ]
+        return to_ints(values, name)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        cook.recipes_changed([instance.pk])
+        instance.delete()
+        User.objects.filter(pk=instance.author_id).update(
+            recipes_count=Greatest(F('recipes_count') - 1, 0))
 
     def add(self, model, user, pk, name):
         """Добавление рецепта в список пользователя."""
@@ -47,18 +270,33 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return Response(
                 {'errors': f'Нельзя повторно добавить рецепт в {name}'},
                 status=status.HTTP_400_BAD_REQUEST)
-        model.objects.create(user=user, recipe=recipe)
+        with transaction.atomic():
+            model.objects.create(user=user, recipe=recipe)
+            Recipe.objects.filter(pk=recipe.pk).update(
+                **{model.counter_field: F(model.counter_field) + 1})
+            if model is Favorite:
+                response_cache.purge([response_cache.FAVORITES])
         serializer = SmallRecipeSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete_relation(self, model, user, pk, name):
         """"Удаление рецепта из списка пользователя."""
         recipe = get_object_or_404(Recipe, pk=pk)
-        if not model.objects.filter(user=user, recipe=recipe).exists():
+        with transaction.atomic():
+            deleted, _ = model.objects.filter(
+                user=user, recipe=recipe).delete()
+            if deleted:
+                # Не ниже нуля, даже если счетчик еще не сверен.
+                Recipe.objects.filter(pk=recipe.pk).update(**{
+                    model.counter_field: Greatest(
+                        F(model.counter_field) - 1, 0)
+                })
+            if deleted and model is Favorite:
+                response_cache.purge([response_cache.FAVORITES])
+        if not deleted:
             return Response(
                 {'errors': f'Нельзя повторно удалить рецепт из {name}'},
                 status=status.HTTP_400_BAD_REQUEST)
-        model.objects.filter(user=user, recipe=recipe).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -111,32 +349,35 @@ class RecipeViewSet(viewsets.ModelViewSet):
         methods=['get'],
         detail=False,
         url_path='download_shopping_cart',
-        url_name='download_shopping_cart'
+        url_name='download_shopping_cart',
+        permission_classes=[IsAuthenticated]
     )
     def download_cart(self, request):
-        """Формирование и скачивание списка покупок."""
+        """Формирование и скачивание списка покупок.
+
+        Формат задается параметром file_format (pdf, txt, csv, json).
+        ETag зависит от версии списка покупок, поэтому повторное
+        скачивание неизмененного списка возвращает 304.
+        """
+        file_format = request.query_params.get('file_format', 'pdf')
+        renderer = get_renderer(file_format)
+        if renderer is None:
+            return Response(
+                {'errors': f'Доступные форматы: {", ".join(RENDERERS)}'},
+                status=status.HTTP_400_BAD_REQUEST)
         user = request.user
-        ingredients = IngredientAmount.objects.filter(
-            recipe__sh_cart__user=user).values(
-                'ingredient__name', 'ingredient__measurement_unit').annotate(
-                    Sum('amount', distinct=True))
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.add_font(
-            'Shentox', '', './backend/fonts/Shentox.ttf', uni=True)
-        pdf.set_font('Shentox', size=12)
-        pdf.cell(txt='Список покупок', center=True)
-        pdf.ln(10)
-        for i, ingredient in enumerate(ingredients):
-            name = ingredient['ingredient__name']
-            unit = ingredient['ingredient__measurement_unit']
-            amount = ingredient['amount__sum']
-            pdf.cell(30, 10, f'{i + 1}) {name} - {amount} {unit}')
-            pdf.ln()
-        file = pdf.output(dest='S')
-        response = HttpResponse(
-            content_type='application/pdf', status=status.HTTP_200_OK)
-        response['Content-Disposition'] = (
-            'attachment; filename="список_покупок.pdf"')
-        response.write(bytes(file))
+        shopping_list.ensure_built(user)
+        version = shopping_list.get_version(user)
+        etag = quote_etag(f'{version}-{renderer.extension}')
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+        if etag in parse_etags(if_none_match) or if_none_match == '*':
+            response = HttpResponseNotModified()
+        else:
+            items = shopping_list.get_items(user)
+            response = renderer.response(
+                items.iterator(),
+                shopping_list.document_key(user, version, renderer.extension)
+            )
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
         return response
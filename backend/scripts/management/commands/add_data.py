@@ -1,45 +1,141 @@
 import csv
+import io
+import json
 import os
+from itertools import islice
+from timeit import default_timer
 
-import psycopg2
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes import cache
+from recipes.models import Ingredient
+
+HEADER = ['name', 'measurement_unit']
+CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    """Строки (name, measurement_unit) из .csv; заголовок необязателен."""
+    for row in csv.reader(file):
+        if row and row != HEADER:
+            name, unit = row
+            yield name, unit
+
+
+def read_json(file):
+    """Строки (name, measurement_unit) из массива JSON или JSON Lines.
+
+    Файл читается частями, объекты разбираются по одному.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), ''):
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in '[], \r\n\t':
+                position += 1
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item['name'], item['measurement_unit']
+        buffer = buffer[position:]
+    if buffer.strip(' ]\r\n\t'):
+        raise CommandError('Файл .json обрезан или содержит ошибки')
+
+
+READERS = {'csv': read_csv, 'json': read_json}
+
+
+def unique(rows):
+    seen = set()
+    for row in rows:
+        row = tuple(value.strip() for value in row)
+        if row not in seen:
+            seen.add(row)
+            yield row
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
 
 
 class Command(BaseCommand):
-    help = 'Добавление записей в БД из файлов .csv'
+    help = 'Загрузка справочника ингредиентов из файлов .csv и .json'
 
     def add_arguments(self, parser):
-        """Аргументы для пути к файлу .csv и имени таблицы."""
-        parser.add_argument('path', type=str, help='Путь к файлу .csv')
-        parser.add_argument('tab_name', type=str,
-                            help='Имя таблицы postgresql')
+        """Путь к файлу, формат и размер пачки."""
+        parser.add_argument('path', type=str, help='Путь к файлу')
+        parser.add_argument(
+            '--format', choices=READERS, dest='file_format',
+            help='Формат файла, по умолчанию - по расширению'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Количество строк в одной пачке'
+        )
 
     def handle(self, *args, **kwargs):
         path = kwargs['path']
-        table = kwargs['tab_name']
         if not os.path.isfile(path):
             raise CommandError(f'Файл "{path}" не найден')
-        if not table.isidentifier():
-            raise CommandError(f'Невалидное имя таблицы "{table}"')
-        conn = psycopg2.connect(
-            host=os.getenv('DB_HOST'),
-            dbname=os.getenv('DB_NAME'),
-            user=os.getenv('POSTGRES_USER'),
-            password=os.getenv('POSTGRES_PASSWORD'),
-        )
-        with conn, conn.cursor() as cur:
-            with open(path, 'r') as file:
-                reader = csv.reader(file)
-                next(reader)
-                for row in reader:
-                    name, unit = row
-                    cur.execute(
-                        f'INSERT INTO {table} ('
-                        f'name, measurement_unit) VALUES (%s, %s)',
-                        (name, unit)
-                    )
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f'Записи успешно добавлены в таблицу {table}'
-                )
+        file_format = (
+            kwargs['file_format'] or os.path.splitext(path)[1].lstrip('.'))
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла "{file_format}"')
+        write = (
+            self.copy_batch if connection.vendor == 'postgresql'
+            else self.bulk_create_batch)
+        read = created = 0
+        start = default_timer()
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            rows = unique(READERS[file_format](file))
+            for batch in batches(rows, kwargs['batch_size']):
+                read += len(batch)
+                created += write(batch)
+        # Вставка идет мимо сигналов моделей.
+        cache.bump_versions(['ingredients'])
+        elapsed = default_timer() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано {read}, добавлено {created} ингредиентов '
+            f'за {elapsed:.2f} с ({read / (elapsed or 1):.0f} строк/с)'
+        ))
+
+    def copy_batch(self, batch):
+        """COPY во временную таблицу и вставка без дублей."""
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS ingredient_import '
+                '(name varchar(200), measurement_unit varchar(200)) '
+                'ON COMMIT DROP'
+            )
+            cursor.execute('TRUNCATE ingredient_import')
+            cursor.copy_expert(
+                'COPY ingredient_import (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)', buffer)
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                f'SELECT name, measurement_unit FROM ingredient_import '
+                f'ON CONFLICT (name, measurement_unit) DO NOTHING'
             )
+            return cursor.rowcount
+
+    def bulk_create_batch(self, batch):
+        before = Ingredient.objects.count()
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=unit)
+             for name, unit in batch),
+            ignore_conflicts=True
+        )
+        return Ingredient.objects.count() - before
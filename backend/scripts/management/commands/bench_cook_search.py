@@ -0,0 +1,59 @@
+import random
+from timeit import default_timer
+
+from django.core.management.base import BaseCommand
+
+from recipes.cook import CookIndex
+
+
+class Command(BaseCommand):
+    help = ('Замер подбора рецептов по ингредиентам (include/exclude) '
+            'на синтетическом каталоге')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **kwargs):
+        generator = random.Random(0)
+        ingredients = range(1, kwargs['ingredients'] + 1)
+        # Частота ингредиентов убывает, как у соли и шафрана.
+        weights = [1 / rank for rank in ingredients]
+        start = default_timer()
+        rows = [
+            (recipe_id, ingredient_id)
+            for recipe_id in range(1, kwargs['recipes'] + 1)
+            for ingredient_id in set(generator.choices(
+                ingredients, weights, k=generator.randint(4, 12)))
+        ]
+        self.stdout.write(
+            f'Каталог: {kwargs["recipes"]} рецептов, {len(rows)} связей '
+            f'за {default_timer() - start:.2f} с')
+        start = default_timer()
+        index = CookIndex(rows)
+        self.stdout.write(
+            f'Индекс построен за {default_timer() - start:.2f} с')
+        self.stdout.write(
+            f'{"include":>8}{"exclude":>8}{"среднее":>12}{"p95":>12}'
+            f'{"найдено":>10}')
+        cases = (
+            (1, 0, ingredients), (3, 1, ingredients), (5, 2, ingredients),
+            (10, 2, ingredients),
+            # Худший случай: самые частые ингредиенты.
+            (5, 2, ingredients[:20]),
+        )
+        for include_size, exclude_size, pool in cases:
+            timings, found = [], 0
+            for _ in range(kwargs['repeat']):
+                include = generator.sample(pool, include_size)
+                exclude = generator.sample(ingredients[:50], exclude_size)
+                start = default_timer()
+                found += len(index.search(include, exclude, 1000))
+                timings.append((default_timer() - start) * 1000)
+            timings.sort()
+            self.stdout.write(
+                f'{include_size:>8}{exclude_size:>8}'
+                f'{sum(timings) / len(timings):>10.2f}мс'
+                f'{timings[int(len(timings) * 0.95)]:>10.2f}мс'
+                f'{found // kwargs["repeat"]:>10}')
@@ -0,0 +1,115 @@
+import csv
+import os
+import random
+from timeit import default_timer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIRequestFactory
+
+from recipes.autocomplete import IngredientIndex
+from recipes.ingr_filters import CustomSearchFilter
+from recipes.models import Ingredient
+
+QUERIES = (
+    'п', 'пом', 'сах', 'мол', 'помид', 'сахр', 'помидр', 'чесног',
+    # Опечатка в недописанном слове.
+    'помад', 'малок', 'кортоф',
+)
+
+
+class Command(BaseCommand):
+    help = ('Сравнение поиска ингредиентов по индексу в памяти '
+            'с фильтром по началу названия')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=os.path.join(settings.BASE_DIR, 'ingredients.csv'),
+            help='Файл .csv со справочником ингредиентов'
+        )
+        parser.add_argument(
+            '--synthetic', type=int, default=100000,
+            help='Размер синтетического справочника (0 - не строить)'
+        )
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--db', action='store_true',
+            help='Также замерить фильтр ^name на таблице в текущей БД'
+        )
+
+    def handle(self, *args, **kwargs):
+        path = kwargs['path']
+        if not os.path.isfile(path):
+            raise CommandError(f'Файл "{path}" не найден')
+        with open(path, encoding='utf-8') as file:
+            rows = [
+                {'id': i, 'name': name, 'measurement_unit': unit}
+                for i, (name, unit) in enumerate(csv.reader(file), 1)
+            ]
+        self.bench(f'Справочник ({len(rows)})', rows, kwargs['repeat'])
+        if kwargs['synthetic']:
+            synthetic = self.synthetic(rows, kwargs['synthetic'])
+            self.bench(
+                f'Синтетический ({len(synthetic)})',
+                synthetic, kwargs['repeat'])
+        if kwargs['db']:
+            self.bench_db(kwargs['repeat'])
+
+    def synthetic(self, rows, size):
+        """Уникальные названия из сочетаний слов справочника."""
+        generator = random.Random(0)
+        words = sorted({word for row in rows for word in row['name'].split()})
+        names = {row['name'] for row in rows}
+        while len(names) < size:
+            names.add(' '.join(generator.sample(words, 2)))
+        return [
+            {'id': i, 'name': name, 'measurement_unit': 'г'}
+            for i, name in enumerate(sorted(names), 1)
+        ]
+
+    def timed(self, func, repeat):
+        """Среднее время вызова в микросекундах."""
+        start = default_timer()
+        for _ in range(repeat):
+            func()
+        return (default_timer() - start) / repeat * 10 ** 6
+
+    def bench(self, title, rows, repeat):
+        start = default_timer()
+        index = IngredientIndex(rows)
+        build = default_timer() - start
+        names = [row['name'] for row in rows]
+        self.stdout.write(f'{title}: индекс построен за {build:.2f} с')
+        self.stdout.write(
+            f'{"запрос":<10}{"скан ^name":>14}{"префикс":>12}'
+            f'{"нечеткий":>12}{"найдено":>10}')
+        for query in QUERIES:
+            # Последовательный просмотр, как ILIKE 'x%' без индекса.
+            scan = self.timed(lambda: [
+                name for name in names
+                if name.casefold().startswith(query.casefold())
+            ], repeat)
+            prefix = self.timed(lambda: index.prefix(query, 10), repeat)
+            fuzzy = self.timed(lambda: index.fuzzy(query, 10), repeat)
+            found = len(index.fuzzy(query, 10))
+            self.stdout.write(
+                f'{query:<10}{scan:>12.0f}мкс{prefix:>9.0f}мкс'
+                f'{fuzzy:>9.0f}мкс{found:>10}')
+
+    def bench_db(self, repeat):
+        count = Ingredient.objects.count()
+        self.stdout.write(f'БД, фильтр ^name ({count} строк):')
+        factory = APIRequestFactory()
+        view = type('View', (), {'search_fields': ('^name',)})()
+        for query in QUERIES:
+            request = factory.get(
+                '/', {CustomSearchFilter.search_param: query})
+            request.query_params = request.GET
+
+            def run():
+                return list(CustomSearchFilter().filter_queryset(
+                    request, Ingredient.objects.all(), view))
+
+            self.stdout.write(
+                f'{query:<10}{self.timed(run, repeat):>12.0f}мкс')
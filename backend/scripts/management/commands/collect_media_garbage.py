@@ -0,0 +1,72 @@
+import os
+import posixpath
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.images import VARIANTS_DIR
+from recipes.models import Recipe
+
+
+def walk(storage, path):
+    """Имена всех файлов в каталоге path хранилища."""
+    if not storage.exists(path):
+        return
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield posixpath.join(path, name)
+    for directory in directories:
+        yield from walk(storage, posixpath.join(path, directory))
+
+
+class Command(BaseCommand):
+    help = ('Удаление картинок рецептов и их уменьшенных копий, '
+            'на которые не ссылается ни один рецепт')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60,
+            help='Не трогать файлы моложе, с (загрузки в незавершенных '
+                 'транзакциях)'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено'
+        )
+
+    def handle(self, *args, **kwargs):
+        self.dry_run = kwargs['dry_run']
+        self.deadline = timezone.now() - timedelta(seconds=kwargs['min_age'])
+        storage = Recipe._meta.get_field('image').storage
+        upload_to = Recipe._meta.get_field('image').upload_to.rstrip('/')
+        images = set(Recipe.objects.values_list('image', flat=True))
+        hashes = set(Recipe.objects.values_list('image_hash', flat=True))
+        removed = 0
+        for name in walk(storage, upload_to):
+            if (not name.startswith(VARIANTS_DIR + '/')
+                    and name not in images):
+                removed += self.remove(storage, name)
+        if default_storage.exists(VARIANTS_DIR):
+            for image_hash in default_storage.listdir(VARIANTS_DIR)[0]:
+                if image_hash in hashes:
+                    continue
+                directory = posixpath.join(VARIANTS_DIR, image_hash)
+                for name in walk(default_storage, directory):
+                    removed += self.remove(default_storage, name)
+                if not self.dry_run and not any(
+                        default_storage.listdir(directory)):
+                    os.rmdir(default_storage.path(directory))
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Будет удалено" if self.dry_run else "Удалено"} '
+            f'файлов: {removed}'))
+
+    def remove(self, storage, name):
+        if storage.get_modified_time(name) > self.deadline:
+            return 0
+        if self.dry_run:
+            self.stdout.write(name)
+        else:
+            storage.delete(name)
+        return 1
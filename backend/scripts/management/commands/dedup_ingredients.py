@@ -0,0 +1,99 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Min
+
+from recipes import cache
+from recipes.models import Ingredient, IngredientAmount, ShoppingListItem
+
+
+def delete_rows(model, ids):
+    """DELETE без сигналов и каскадов ORM: команда выполняется
+    до migrate, когда новых таблиц и столбцов еще нет."""
+    ids = list(ids)
+    if not ids:
+        return
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.pk.column)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE {column} IN ({placeholders})', ids)
+
+
+def duplicates():
+    """Дубли ингредиентов: {id дубля: наименьший id с тем же name
+    и measurement_unit}."""
+    groups = Ingredient.objects.order_by().values(
+        'name', 'measurement_unit').annotate(
+            keep=Min('id'), count=Count('id')).filter(count__gt=1)
+    mapping = {}
+    for group in groups:
+        for ingredient_id in Ingredient.objects.filter(
+                name=group['name'],
+                measurement_unit=group['measurement_unit']
+        ).exclude(pk=group['keep']).values_list('id', flat=True):
+            mapping[ingredient_id] = group['keep']
+    return mapping
+
+
+def merge_amounts(mapping):
+    """Переносит IngredientAmount дублей на оставляемые ингредиенты.
+    Если в рецепте есть оба, количества складываются."""
+    rows = list(IngredientAmount.objects.filter(
+        ingredient__in=mapping).values_list(
+            'id', 'recipe_id', 'ingredient_id', 'amount'))
+    targets = {
+        (recipe_id, ingredient_id): [amount_id, amount, False]
+        for amount_id, recipe_id, ingredient_id, amount in
+        IngredientAmount.objects.filter(
+            ingredient__in=set(mapping.values()),
+            recipe__in={row[1] for row in rows}
+        ).values_list('id', 'recipe_id', 'ingredient_id', 'amount')
+    }
+    repointed, merged = {}, []
+    for amount_id, recipe_id, ingredient_id, amount in rows:
+        keep = mapping[ingredient_id]
+        target = targets.get((recipe_id, keep))
+        if target is None:
+            targets[recipe_id, keep] = [amount_id, amount, False]
+            repointed.setdefault(keep, []).append(amount_id)
+        else:
+            target[1] += amount
+            target[2] = True
+            merged.append(amount_id)
+    delete_rows(IngredientAmount, merged)
+    for keep, ids in repointed.items():
+        IngredientAmount.objects.filter(pk__in=ids).update(ingredient=keep)
+    for amount_id, amount, changed in targets.values():
+        if changed:
+            IngredientAmount.objects.filter(pk=amount_id).update(
+                amount=amount)
+    return len(rows)
+
+
+class Command(BaseCommand):
+    help = ('Объединение дублей ингредиентов (name, measurement_unit) '
+            'перед migrate: ссылки переносятся на дубль с наименьшим id, '
+            'остальные удаляются')
+
+    @transaction.atomic
+    def handle(self, *args, **kwargs):
+        tables = connection.introspection.table_names()
+        if Ingredient._meta.db_table not in tables:
+            # Новая установка: таблиц еще нет.
+            self.stdout.write(self.style.SUCCESS('Дублей ингредиентов нет'))
+            return
+        mapping = duplicates()
+        if not mapping:
+            self.stdout.write(self.style.SUCCESS('Дублей ингредиентов нет'))
+            return
+        amounts = merge_amounts(mapping)
+        # Сводные списки покупок пересчитываются rebuild_shopping_lists.
+        if ShoppingListItem._meta.db_table in tables:
+            delete_rows(ShoppingListItem, ShoppingListItem.objects.filter(
+                ingredient__in=mapping).values_list('id', flat=True))
+        delete_rows(Ingredient, mapping)
+        cache.bump_versions(['ingredients'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено дублей ингредиентов: {len(mapping)}, '
+            f'перенесено количеств в рецептах: {amounts}'))
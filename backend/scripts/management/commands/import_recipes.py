@@ -0,0 +1,88 @@
+import json
+import os
+import zipfile
+from contextlib import ExitStack
+from timeit import default_timer
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.bulk import chunks, import_recipes
+from users.models import User
+
+RECIPES_FILE = 'recipes.jsonl'
+
+
+class Command(BaseCommand):
+    help = ('Пакетный импорт рецептов из файла JSON Lines или архива .zip '
+            f'({RECIPES_FILE} и картинки, на которые ссылается поле image)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='Путь к .jsonl или .zip')
+        parser.add_argument(
+            '--author', required=True,
+            help='Email или имя пользователя - автора рецептов'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Количество рецептов в одной транзакции'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Количество рецептов, проверяемых вместе'
+        )
+
+    def handle(self, *args, **kwargs):
+        path = kwargs['path']
+        if not os.path.isfile(path):
+            raise CommandError(f'Файл "{path}" не найден')
+        author = User.objects.filter(
+            email=kwargs['author']).first() or User.objects.filter(
+                username=kwargs['author']).first()
+        if author is None:
+            raise CommandError(f'Пользователь "{kwargs["author"]}" не найден')
+        created = failed = 0
+        start = default_timer()
+        with ExitStack() as stack:
+            archive = None
+            if zipfile.is_zipfile(path):
+                archive = stack.enter_context(zipfile.ZipFile(path))
+                lines = stack.enter_context(archive.open(RECIPES_FILE))
+            else:
+                lines = stack.enter_context(open(path, 'rb'))
+            numbered = (
+                (number, line)
+                for number, line in enumerate(lines, 1) if line.strip()
+            )
+            for chunk in chunks(numbered, kwargs['chunk_size']):
+                items = [self.parse(line, archive) for _, line in chunk]
+                results = import_recipes(
+                    author, items, kwargs['batch_size'])
+                for result in results:
+                    if 'id' in result:
+                        created += 1
+                        continue
+                    failed += 1
+                    number = chunk[result['index']][0]
+                    errors = json.dumps(result['errors'], ensure_ascii=False)
+                    self.stderr.write(f'Строка {number}: {errors}')
+        elapsed = default_timer() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано {created}, с ошибками {failed} рецептов '
+            f'за {elapsed:.2f} с ({created / (elapsed or 1):.0f} рецептов/с)'
+        ))
+
+    def parse(self, line, archive):
+        """Элемент импорта. Для архива поле image - имя файла в нем."""
+        try:
+            item = json.loads(line)
+        except ValueError:
+            return {}
+        image = item.get('image') if isinstance(item, dict) else None
+        if archive is not None and isinstance(image, str):
+            try:
+                item['image'] = ContentFile(
+                    archive.read(image), name=os.path.basename(image))
+            except KeyError:
+                item['image'] = None
+        return item
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from recipes import images
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Построение уменьшенных копий картинок рецептов; без --all - '
+            'только необработанных, в том числе потерянных пулом '
+            'при перезапуске воркера')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Обработать и уже обработанные рецепты'
+        )
+
+    def handle(self, *args, **kwargs):
+        recipes = Recipe.objects.exclude(image='')
+        if not kwargs['all']:
+            recipes = recipes.filter(image_hash='')
+        processed = failed = 0
+        for recipe_id in recipes.values_list('id', flat=True).iterator():
+            if images.run(recipe_id):
+                processed += 1
+            else:
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {processed}'))
+        if failed:
+            self.stdout.write(self.style.ERROR(
+                f'Ошибки обработки (см. лог): {failed}'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from recipes import response_cache
+
+
+class Command(BaseCommand):
+    help = ('Сброс закэшированных ответов по суррогатным ключам '
+            '(recipes, recipe:<id>, user:<id>, tags, ingredients, favorites)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('keys', nargs='+')
+
+    def handle(self, *args, **options):
+        response_cache.purge(options['keys'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Сброшены ключи: {" ".join(options["keys"])}'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recipes import feed
+from users.models import Subscription
+
+
+class Command(BaseCommand):
+    help = 'Заполнение лент подписок последними рецептами авторов'
+
+    def handle(self, *args, **kwargs):
+        subscriptions = Subscription.objects.select_related('user', 'author')
+        for subscription in subscriptions.iterator():
+            feed.backfill(subscription.user, subscription.author)
+        self.stdout.write(self.style.SUCCESS('Ленты подписок заполнены'))
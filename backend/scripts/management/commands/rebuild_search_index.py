@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from recipes import search
+from recipes.bulk import chunks
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Пересчет поисковых векторов всех рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество рецептов в одном запросе'
+        )
+
+    def handle(self, *args, **kwargs):
+        ids = Recipe.objects.values_list('id', flat=True).iterator()
+        total = 0
+        for batch in chunks(ids, kwargs['batch_size']):
+            search.update_vectors(batch)
+            total += len(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковые векторы пересчитаны: {total}'))
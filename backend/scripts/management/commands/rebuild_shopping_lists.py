@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recipes import shopping_list
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Пересчет сводных списков покупок пользователей по корзинам'
+
+    def handle(self, *args, **kwargs):
+        users = User.objects.filter(sh_cart__isnull=False).distinct()
+        for user in users.iterator():
+            shopping_list.rebuild(user)
+        self.stdout.write(self.style.SUCCESS('Списки покупок пересчитаны'))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes import response_cache
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+
+def count_of(model, field):
+    """Подзапрос: количество строк model, ссылающихся на строку
+    внешнего запроса через field."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by().values(field).annotate(count=Count('pk'))
+        .values('count')
+    ), 0)
+
+
+def repair(queryset, counters, batch_size=1000):
+    """Исправляет разошедшиеся счетчики {поле: выражение}.
+    Возвращает id исправленных строк."""
+    actual = {f'actual_{field}': value for field, value in counters.items()}
+    mismatch = Q()
+    for field in counters:
+        mismatch |= ~Q(**{field: F(f'actual_{field}')})
+    rows = list(
+        queryset.annotate(**actual).filter(mismatch)
+        .only('pk', *counters)
+    )
+    for row in rows:
+        for field in counters:
+            setattr(row, field, getattr(row, f'actual_{field}'))
+    queryset.model.objects.bulk_update(
+        rows, list(counters), batch_size=batch_size)
+    return [row.pk for row in rows]
+
+
+class Command(BaseCommand):
+    help = 'Сверка денормализованных счетчиков с фактическими данными'
+
+    def handle(self, *args, **kwargs):
+        recipe_ids = repair(Recipe.objects.all(), {
+            'favorites_count': count_of(Favorite, 'recipe'),
+            'shopping_cart_count': count_of(ShoppingCart, 'recipe'),
+        })
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлены счетчики рецептов: {len(recipe_ids)}'))
+        user_ids = repair(User.objects.all(), {
+            'recipes_count': count_of(Recipe, 'author'),
+            'followers_count': count_of(Subscription, 'author'),
+        })
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлены счетчики пользователей: {len(user_ids)}'))
+        # bulk_update не отправляет сигналы: закэшированные ответы
+        # и фрагменты с исправленными счетчиками сбрасываются здесь.
+        if recipe_ids or user_ids:
+            response_cache.purge_recipes(recipe_ids, user_ids)
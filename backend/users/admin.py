@@ -60,7 +60,7 @@ class RecipeAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
     def count_added(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
 
 
 class IngredientAmountAdmin(admin.ModelAdmin):
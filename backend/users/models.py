@@ -31,6 +31,18 @@ class User(AbstractUser):
         verbose_name='Пароль',
         max_length=150,
     )
+    # Счетчики обновляются при создании и удалении рецептов
+    # и подписок и сверяются командой recount_counters.
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ('id',)
@@ -1,6 +1,7 @@
 from drf_base64.fields import Base64ImageField
 from rest_framework import serializers
 
+from recipes import images
 from recipes.models import Recipe
 from users.models import Subscription, User
 
@@ -9,12 +10,16 @@ from users.models import Subscription, User
 # приложения recipe. пришлось хардкорить
 class SmallRecipeSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
+    def get_image_variants(self, obj):
+        return images.variant_urls(obj, self.context.get('request'))
+
 
 class CustomUserSerializer(serializers.ModelSerializer):
     """Сериализатор пользователя"""
@@ -29,7 +34,9 @@ class CustomUserSerializer(serializers.ModelSerializer):
             'email',
             'first_name',
             'last_name', 'password',
-            'is_subscribed'
+            'is_subscribed',
+            'recipes_count',
+            'followers_count'
         )
         write_only_fields = ('password',)
 
@@ -56,7 +63,9 @@ class SubscriptionSerializer(serializers.ModelSerializer):
     first_name = serializers.ReadOnlyField(source='author.first_name')
     last_name = serializers.ReadOnlyField(source='author.last_name')
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.ReadOnlyField(source='author.recipes.count')
+    recipes_count = serializers.ReadOnlyField(source='author.recipes_count')
+    followers_count = serializers.ReadOnlyField(
+        source='author.followers_count')
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -69,18 +78,24 @@ class SubscriptionSerializer(serializers.ModelSerializer):
             'last_name',
             'recipes',
             'recipes_count',
+            'followers_count',
             'is_subscribed',
         )
 
     def get_is_subscribed(self, obj):
         """Статус подписки на пользователя."""
         user = self.context.get('request').user
+        if obj.user_id == user.id:
+            return True
         return Subscription.objects.filter(
             author=obj.author, user=user).exists()
 
     def get_recipes(self, obj):
         """Получение рецептов пользователя."""
-
+        if hasattr(obj.author, 'recipes_preview'):
+            serializer = SmallRecipeSerializer(
+                obj.author.recipes_preview, many=True)
+            return serializer.data
         limit = self.context.get('request').GET.get('recipes_limit')
         recipe_obj = obj.author.recipes.all()
         if limit:
@@ -1,3 +1,6 @@
+from django.db import transaction
+from django.db.models import F, Prefetch, prefetch_related_objects
+from django.db.models.functions import Greatest
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status
@@ -6,6 +9,8 @@ from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from recipes import feed, response_cache
+from recipes.models import Recipe
 from users.serializers import SubscriptionSerializer
 
 from .models import Subscription, User
@@ -13,6 +18,7 @@ from .models import Subscription, User
 
 class CustomUserViewSet(UserViewSet):
     queryset = User.objects.all()
+    cursor_ordering = ('id',)
 
     @action(
         detail=False,
@@ -23,12 +29,35 @@ class CustomUserViewSet(UserViewSet):
     def subscriptions(self, request):
         """Список пользователей, на которых подписан пользователь."""
         user = request.user
-        queryset = user.follower.all()
+        queryset = user.follower.select_related('author').order_by('id')
         pages = self.paginate_queryset(queryset)
+        self.prefetch_recipes_preview(pages, self.get_recipes_limit(request))
         serializer = SubscriptionSerializer(
             pages, many=True, context={'request': request})
         return self.get_paginated_response(serializer.data)
 
+    def get_recipes_limit(self, request):
+        """Значение параметра recipes_limit."""
+        limit = request.query_params.get('recipes_limit')
+        if not limit:
+            return None
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValidationError(
+                {'recipes_limit': ['Должно быть целым числом.']})
+        return max(limit, 0)
+
+    def prefetch_recipes_preview(self, subscriptions, limit):
+        """Загружает превью рецептов всех авторов страницы одним запросом
+        в атрибут author.recipes_preview."""
+        authors = [subscription.author_id for subscription in subscriptions]
+        prefetch_related_objects(subscriptions, Prefetch(
+            'author__recipes',
+            queryset=Recipe.objects.latest_per_author(authors, limit),
+            to_attr='recipes_preview'
+        ))
+
     @action(
         methods=['post', 'delete'],
         detail=True,
@@ -45,12 +74,19 @@ class CustomUserViewSet(UserViewSet):
         subscription = Subscription.objects.filter(
             author=author, user=user)
         if request.method == 'POST':
-            subscription, created = Subscription.objects.get_or_create(
-                author=author,
-                user=user
-            )
+            with transaction.atomic():
+                subscription, created = Subscription.objects.get_or_create(
+                    author=author,
+                    user=user
+                )
+                if created:
+                    User.objects.filter(pk=author.pk).update(
+                        followers_count=F('followers_count') + 1)
+                    feed.backfill(user, author)
+                    response_cache.purge([response_cache.user_key(author.pk)])
             if not created:
                 raise ValidationError('Нельзя подписаться повторно')
+            subscription.author.refresh_from_db(fields=['followers_count'])
             serializer = SubscriptionSerializer(
                 subscription,
                 context={'request': request}
@@ -65,7 +101,12 @@ class CustomUserViewSet(UserViewSet):
                 raise ValidationError(
                     'Нельзя отписаться от неподписанного автора'
                 )
-            subscription.delete()
+            with transaction.atomic():
+                subscription.delete()
+                User.objects.filter(pk=author.pk).update(
+                    followers_count=Greatest(F('followers_count') - 1, 0))
+                feed.remove(user, author)
+                response_cache.purge([response_cache.user_key(author.pk)])
             return Response(status=status.HTTP_204_NO_CONTENT)
         else:
             raise ValidationError('Метод не поддерживается')